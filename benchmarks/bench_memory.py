@@ -0,0 +1,208 @@
+"""
+Memory of the served model: columnar arrays against nested dicts.
+
+    python -m benchmarks.bench_memory [--rows 100000]
+
+Builds a synthetic dataset (see benchmarks/synthetic.py) and measures, each in
+a fresh process, the memory held once the data is loaded:
+
+- nested: the load_schools() GeoJSON as it was kept per snapshot, with a dict
+  per location, school and position and the JSON of every feature
+- columnar: the model of the snapshot (mouvement/model.py)
+- snapshot: the whole prepared snapshot, model, indexes and payloads, with
+  its arrays mapped from the packed file (mouvement/packed.py)
+
+The Python heap is measured with tracemalloc and the resident set size (RSS)
+in a separate run without it, along with the part of it that is a shared file
+mapping, held once whatever the number of server workers. Every feature and a sample of school details
+produced by the columnar model are checked against the nested data.
+"""
+import argparse
+import json
+import logging
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.bench_pipeline import working_directory
+from benchmarks.synthetic import generate
+
+VARIANTS = ('nested', 'columnar', 'snapshot')
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def nested_feature(feature, rep_set):
+    """The map feature of a location, computed from the nested GeoJSON"""
+    uais = list(dict.fromkeys(school['uai'] for school in feature['properties']['schools']))
+    return {
+        "type": "Feature",
+        "id": feature['id'],
+        "geometry": {"type": "Point", "coordinates": [round(c, 6) for c in feature['geometry']['coordinates']]},
+        "properties": {
+            "uais": uais,
+            "rep": any(uai in rep_set for uai in uais),
+            "vacants": feature['properties']['vacants'],
+            "susceptibles": feature['properties']['susceptibles'],
+        },
+    }
+
+
+def nested_detail(school, rep_set):
+    """The popup details of a school, computed from the nested GeoJSON"""
+    detail = {key: school[key] for key in ('uai', 'name', 'city', 'address', 'directions_url', 'positions')}
+    detail['rep'] = school['uai'] in rep_set
+    return detail
+
+
+def load_nested(path):
+    """The structures kept with nested data: the features, a UAI index and the feature JSON"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    rep_set = set(data['rep_schools'])
+    schools_by_uai = {}
+    for feature in data['features']:
+        for school in feature['properties']['schools']:
+            schools_by_uai.setdefault(school['uai'], []).append(school)
+    features_json = [json.dumps(nested_feature(f, rep_set)) for f in data['features']]
+    return schools_by_uai, features_json
+
+
+def load_columnar(path):
+    from mouvement.model import Model, model_arrays
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return Model(model_arrays(data['model'], data['rep_schools']))
+
+
+def load_snapshot(path):
+    from mouvement.snapshot import SnapshotStore
+
+    return SnapshotStore(Path(path).parent).get()
+
+
+def _rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _shared_mb():
+    """Resident memory backed by shared clean pages, i.e. mapped files"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Shared_Clean:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def child(variant, path, trace):
+    """Load one variant and print the memory it holds, as JSON"""
+    import gc
+    import tracemalloc
+
+    # Imports are not part of the measure
+    import numpy  # noqa: F401
+    import mouvement.snapshot  # noqa: F401
+
+    loader = {'nested': load_nested, 'columnar': load_columnar, 'snapshot': load_snapshot}[variant]
+    gc.collect()
+    before, shared_before = _rss_mb(), _shared_mb()
+    if trace:
+        tracemalloc.start()
+    loaded = loader(path)
+    gc.collect()
+    result = {'rss_mb': round(_rss_mb() - before, 1), 'shared_mb': round(_shared_mb() - shared_before, 1)}
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        result.update(heap_mb=round(current / 1e6, 1), peak_heap_mb=round(peak / 1e6, 1))
+    del loaded
+    print(json.dumps(result))
+
+
+def measure(variant, path):
+    def run(trace):
+        command = [sys.executable, '-m', 'benchmarks.bench_memory', '--child', variant, str(path)]
+        if trace:
+            command.append('--trace')
+        output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=PROJECT_DIR).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    return {**run(trace=True), **run(trace=False)}
+
+
+def check(features, model, rep_set, samples, rng):
+    """The columnar model gives the same JSON as the nested data"""
+    for feature in features:
+        assert model.feature_json(feature['id']) == json.dumps(nested_feature(feature, rep_set)), feature['id']
+    first = {}
+    for feature in features:
+        for school in feature['properties']['schools']:
+            first.setdefault(school['uai'], school)
+    for uai in rng.sample(sorted(first), min(samples, len(first))):
+        assert model.school_detail(model.find(uai)) == nested_detail(first[uai], rep_set), uai
+    assert model.find('0000000A') is None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--samples', type=int, default=2000, help="School details checked")
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.child:
+        child(args.child, args.path, args.trace)
+        return
+
+    from mouvement.annuaire import load_annuaire
+    from mouvement.data import load_schools, read_addresses, read_positions
+    from mouvement.model import Model, model_arrays
+    from mouvement.snapshot import build_snapshot_data, write_snapshot
+
+    with tempfile.TemporaryDirectory(prefix='mouvement-bench-') as tmp, working_directory(tmp):
+        generate(tmp, args.rows, seed=args.seed)
+        positions, addresses = read_positions(), read_addresses()
+        schools_dict = load_annuaire('fr-en-annuaire-education.json')
+
+        data = build_snapshot_data(positions=positions, addresses=addresses, schools_dict=schools_dict)
+        snapshot_path = write_snapshot(data, Path(tmp) / 'snapshots')
+
+        geojson, _, _ = load_schools(positions=positions, addresses=addresses, schools_dict=schools_dict)
+        for i, feature in enumerate(geojson['features']):
+            feature['id'] = i
+        nested_path = Path(tmp) / 'nested.json'
+        nested_path.write_text(json.dumps({'features': geojson['features'], 'rep_schools': data['rep_schools']},
+                                          ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+
+        model = Model(model_arrays(data['model'], data['rep_schools']))
+        check(geojson['features'], model, set(data['rep_schools']), args.samples, random.Random(args.seed))
+        print(f"{args.rows} rows, {len(model)} locations, {len(model.uai)} schools: columnar output checked")
+        print(f"  nested.json {nested_path.stat().st_size:>14,} bytes")
+        print(f"  snapshot    {snapshot_path.stat().st_size:>14,} bytes")
+        print(f"  packed      {snapshot_path.with_suffix('.bin').stat().st_size:>14,} bytes")
+
+        results = {variant: measure(variant, snapshot_path if variant != 'nested' else nested_path)
+                   for variant in VARIANTS}
+
+    for variant, result in results.items():
+        print(f"  {variant:<10} heap {result['heap_mb']:8.1f} MB   peak {result['peak_heap_mb']:8.1f} MB"
+              f"   RSS +{result['rss_mb']:8.1f} MB (shared {result['shared_mb']:.1f} MB)")
+    ratio = results['nested']['heap_mb'] / max(results['columnar']['heap_mb'], 0.1)
+    print(f"  columnar model holds x{ratio:.1f} less heap than nested dicts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Batch nearest-location queries, as served by /api/nearest.
+
+    python -m benchmarks.bench_nearest [--points 100000] [--origins 100] [-n 10]
+
+tests/test_nearest.py checks the answers against a full sort of the haversine
+distances (brute_nearest).
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.bench_spatial import random_points
+from mouvement.nearest import NearestIndex, haversine_km
+
+
+def brute_nearest(index, origins, n, vacant, rep):
+    mask = np.ones(len(index), dtype=bool)
+    if vacant:
+        mask &= index.vacants > 0
+    if rep is not None:
+        mask &= index.rep == rep
+    candidates = np.flatnonzero(mask)
+    results = []
+    for lat, lon in origins:
+        distances = haversine_km(lat, lon, index.lat[candidates], index.lon[candidates])
+        order = np.lexsort((candidates, distances))[:n]
+        results.append(list(zip(distances[order].tolist(), candidates[order].tolist())))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--origins', type=int, default=100)
+    parser.add_argument('-n', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = random_points(args.points, rng)
+    vacants = [1 if rng.random() < 0.3 else 0 for _ in points]
+    rep = [rng.random() < 0.1 for _ in points]
+
+    start = time.perf_counter()
+    index = NearestIndex(points, vacants, rep)
+    print(f"{args.points} points, index built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for vacant, rep_filter in ((False, None), (True, None), (True, True)):
+        timings = []
+        for _ in range(args.repeat):
+            origins = random_points(args.origins, rng)
+            start = time.perf_counter()
+            index.query(origins, n=args.n, vacant=vacant, rep=rep_filter)
+            timings.append((time.perf_counter() - start) * 1000)
+        name = f"vacant={int(vacant)} rep={rep_filter}"
+        print(f"{args.origins} origins, {name:<18} median {statistics.median(timings):8.2f} ms   "
+              f"max {max(timings):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Time of each data stage on synthetic datasets, from the CSVs to the rendered page.
+
+    python -m benchmarks.bench_pipeline [--sizes 1000 10000 100000] [--output results.json]
+                                        [--baseline previous.json]
+
+For each size a dataset is generated in a temporary directory (see
+benchmarks/synthetic.py) and these stages are timed:
+
+- load_csv: read mouvement_complet_clean.csv and schools_with_addresses.csv
+- load_annuaire: stream the annuaire export, keeping the referenced UAIs
+- join: resolve the addresses (school_addresses.resolve_addresses)
+- geojson: group the schools into features (load_schools)
+- snapshot: the whole snapshot content, clusters included (build_snapshot_data)
+- prepare: indexes and compressed payloads of a snapshot (prepare)
+- render: the index.html template
+
+Payload sizes are recorded per encoding. Results are written as JSON; with
+--baseline, each stage is compared to a previous run and the command fails if
+one got slower than --tolerance times its baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.synthetic import generate
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def measure(func, repeat):
+    """Result of the last call and median/min wall time in ms over `repeat` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3)}
+
+
+def bench_size(rows, repeat, seed):
+    from flask import render_template
+
+    from mouvement.annuaire import load_annuaire
+    from mouvement.app import app
+    from mouvement.data import load_schools, referenced_uais
+    from mouvement.snapshot import build_snapshot_data, pack, prepare
+    from school_addresses import COLUMNS, extract_uais, resolve_addresses
+
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix='mouvement-bench-') as tmp, working_directory(tmp):
+        generate(tmp, rows, seed=seed)
+
+        def load_csv():
+            return (pd.read_csv('mouvement_complet_clean.csv', sep=';', encoding='utf-8', header=None),
+                    pd.read_csv('schools_with_addresses.csv', sep=';', encoding='utf-8'))
+        (positions, addresses), stages['load_csv'] = measure(load_csv, repeat)
+
+        uais = set(extract_uais(positions[2]).dropna()) | referenced_uais(addresses)
+        schools_dict, stages['load_annuaire'] = measure(
+            lambda: load_annuaire('fr-en-annuaire-education.json', uais=uais), repeat)
+
+        def join():
+            df = positions.copy()
+            df.columns = COLUMNS
+            resolve_addresses(df, schools_dict)
+            return df
+        _, stages['join'] = measure(join, repeat)
+
+        (geojson, _, _), stages['geojson'] = measure(
+            lambda: load_schools(positions=positions, addresses=addresses, schools_dict=schools_dict), repeat)
+
+        data, stages['snapshot'] = measure(
+            lambda: build_snapshot_data(positions=positions, addresses=addresses, schools_dict=schools_dict), repeat)
+        snapshot, stages['prepare'] = measure(lambda: prepare(*pack(data)), repeat)
+
+        def render():
+            with app.test_request_context('/'):
+                return render_template('index.html', stats=snapshot['stats'],
+                                       bounds=snapshot['bounds'], renderer='markers',
+                                       dataset=None, datasets=[], static_site=None,
+                                       table_html=None)
+        render()  # compile the template outside of the timing
+        page, stages['render'] = measure(render, repeat)
+
+    payloads = {
+        'full_geojson': len(json.dumps(geojson).encode('utf-8')),
+        'index_html': len(page.encode('utf-8')),
+    }
+    for name, payload in snapshot['payloads'].items():
+        for encoding, body in payload['encodings'].items():
+            payloads[f'{name}.{encoding}'] = len(body)
+
+    return {
+        'rows': rows,
+        'features': len(geojson['features']),
+        'stages': stages,
+        'payload_bytes': payloads,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print each stage against the baseline; returns the regressions"""
+    regressions = []
+    for size, result in results['sizes'].items():
+        previous = baseline.get('sizes', {}).get(size)
+        if previous is None:
+            continue
+        print(f"\n{size} rows vs baseline")
+        for stage, timing in result['stages'].items():
+            before = previous['stages'].get(stage)
+            if not before or not before['median_ms']:
+                continue
+            ratio = timing['median_ms'] / before['median_ms']
+            flag = '  SLOWER' if ratio > tolerance else ''
+            print(f"  {stage:<14} {before['median_ms']:10.1f} -> {timing['median_ms']:10.1f} ms  x{ratio:.2f}{flag}")
+            if ratio > tolerance:
+                regressions.append((size, stage, ratio))
+        for name, size_bytes in result['payload_bytes'].items():
+            before = previous['payload_bytes'].get(name)
+            if before and before != size_bytes:
+                print(f"  {name:<22} {before} -> {size_bytes} bytes")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare with the results of a previous run")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="Slowdown ratio over the baseline reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Keep the build logs out of the timings
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'sizes': {},
+    }
+    for rows in args.sizes:
+        result = bench_size(rows, args.repeat, args.seed)
+        results['sizes'][str(rows)] = result
+        print(f"\n{rows} rows, {result['features']} features")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:<14} median {timing['median_ms']:10.1f} ms   min {timing['min_ms']:10.1f} ms")
+        for name, size_bytes in result['payload_bytes'].items():
+            print(f"  {name:<22} {size_bytes:>12,} bytes")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than x{args.tolerance} the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Faceted search with the precomputed bitsets against a pandas filter.
+
+    python -m benchmarks.bench_search [--rows 100000] [--queries 200]
+
+Times random facet filters on a synthetic dataset (see benchmarks/synthetic.py)
+with the bitsets and with a naive pandas filter over the posts. The answers are
+checked against the pandas filter in tests/test_facets.py.
+"""
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_pipeline import working_directory
+from benchmarks.synthetic import generate
+from mouvement.annuaire import load_annuaire
+from mouvement.data import load_rep_status, load_schools, read_addresses, read_positions
+from mouvement.facets import FACETS, NOT_REP, FacetIndex, build_facets, facet_arrays
+
+
+def naive_posts(addresses, features, rep_status):
+    """The posts on the map with their facet values, as one DataFrame"""
+    df = addresses.copy()
+    df['uai'] = df['school_name'].str.extract(r'\(([0-9A-Za-z]+)\)', expand=False).str.upper()
+    feature_of = {s['uai']: f['id'] for f in features for s in f['properties']['schools']}
+    df['feature'] = df['uai'].map(feature_of)
+    df = df.dropna(subset=['feature'])
+    return pd.DataFrame({
+        'feature': df['feature'].astype(int),
+        'commune': df['city'].fillna('').astype(str).str.strip(),
+        'nature': df['nature'].fillna('').astype(str).str.strip(),
+        'specialite': df['specialization'].fillna('').astype(str).str.strip(),
+        'rep': df['uai'].map(lambda uai: rep_status.get(uai, NOT_REP)),
+        'vacant': (pd.to_numeric(df['num_vacant'], errors='coerce').fillna(0) > 0).map({True: '1', False: '0'}),
+    })
+
+
+def naive_search(posts, filters):
+    def filtered(skip=None):
+        mask = pd.Series(True, index=posts.index)
+        for facet, values in filters.items():
+            if facet != skip:
+                mask &= posts[facet].isin(values)
+        return posts[mask]
+
+    matches = filtered()
+    counts = {facet: filtered(skip=facet)[facet].value_counts().to_dict() for facet in FACETS}
+    return sorted(matches['feature'].unique().tolist()), len(matches), counts
+
+
+def random_filters(posts, rng):
+    filters = {}
+    for facet in rng.sample(FACETS, rng.randint(1, 3)):
+        values = posts[facet].unique().tolist()
+        filters[facet] = rng.sample(values, min(len(values), rng.randint(1, 2)))
+    return filters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix='mouvement-bench-') as tmp, working_directory(tmp):
+        generate(tmp, args.rows, seed=args.seed)
+        addresses = read_addresses()
+        schools_dict = load_annuaire('fr-en-annuaire-education.json')
+        geojson, _, _ = load_schools(positions=read_positions(), addresses=addresses, schools_dict=schools_dict)
+        features = geojson['features']
+        for i, feature in enumerate(features):
+            feature['id'] = i
+        rep_status = load_rep_status()
+
+        start = time.perf_counter()
+        facets = build_facets(addresses, features, rep_status)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index = FacetIndex(*facet_arrays(facets))
+        load_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(index.post_feature)} posts on {len(features)} locations: "
+          f"indexes built in {build_ms:.1f} ms, bitsets in {load_ms:.1f} ms")
+
+    posts = naive_posts(addresses, features, rep_status)
+    index_times, naive_times = [], []
+    for _ in range(args.queries):
+        filters = random_filters(posts, rng)
+        start = time.perf_counter()
+        index.search(filters)
+        index_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        naive_search(posts, filters)
+        naive_times.append((time.perf_counter() - start) * 1000)
+
+    print(f"search (bitsets)   median {statistics.median(index_times):8.3f} ms   max {max(index_times):8.3f} ms")
+    print(f"search (pandas)    median {statistics.median(naive_times):8.3f} ms   max {max(naive_times):8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Query latency of the spatial index at académie / national scale.
+
+    python -m benchmarks.bench_spatial [--points 100000] [--queries 200]
+
+Each query is also timed as a brute-force scan of all points; tests/test_spatial.py
+checks that both give the same answers.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from mouvement.spatial import GridIndex, haversine_km
+
+# Rough bounding box of metropolitan France
+FRANCE = (-4.8, 42.3, 8.2, 51.1)
+
+
+def random_points(count, rng):
+    min_lon, min_lat, max_lon, max_lat = FRANCE
+    return [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(count)]
+
+
+def brute_bbox(points, min_lon, min_lat, max_lon, max_lat):
+    return [i for i, (lat, lon) in enumerate(points)
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon]
+
+
+def brute_radius(points, lat, lon, radius_km):
+    matches = sorted((haversine_km(lat, lon, plat, plon), i) for i, (plat, plon) in enumerate(points))
+    return [i for d, i in matches if d <= radius_km]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summary(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<22} median {statistics.median(timings):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = random_points(args.points, rng)
+
+    index, build_ms = timed(GridIndex, points)
+    print(f"{args.points} points, index built in {build_ms:.1f} ms")
+
+    index_times, brute_times = [], []
+    for _ in range(args.queries):
+        # Viewports from a city block to a few départements
+        lat, lon = random_points(1, rng)[0]
+        half = rng.uniform(0.01, 1.0)
+        bbox = (lon - half * 1.5, lat - half, lon + half * 1.5, lat + half)
+        _, ms = timed(index.query_bbox, *bbox)
+        _, brute_ms = timed(brute_bbox, points, *bbox)
+        index_times.append(ms)
+        brute_times.append(brute_ms)
+    summary("bbox (index)", index_times)
+    summary("bbox (brute force)", brute_times)
+
+    index_times, brute_times = [], []
+    for _ in range(args.queries // 4 or 1):
+        lat, lon = random_points(1, rng)[0]
+        radius_km = rng.uniform(1, 50)
+        _, ms = timed(index.query_radius, lat, lon, radius_km)
+        _, brute_ms = timed(brute_radius, points, lat, lon, radius_km)
+        index_times.append(ms)
+        brute_times.append(brute_ms)
+    summary("radius (index)", index_times)
+    summary("radius (brute force)", brute_times)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Cold start of the server: imports and snapshot load, in fresh processes.
+
+    python -m benchmarks.bench_startup [--rows 10000] [--repeat 5] [--output results.json]
+                                       [--baseline previous.json]
+
+A synthetic dataset (see benchmarks/synthetic.py) is built into a snapshot, then
+each run starts a new interpreter that imports mouvement.server and loads the
+snapshot, as `python -m mouvement.server` does before signalling readiness:
+
+- import: `import mouvement.server`
+- load: the snapshot of the default dataset (catalog.get())
+- process: the whole run, interpreter startup included
+
+One more run with `-X importtime` lists the slowest imports. The command fails
+if the serving path imported one of HEAVY_MODULES, which are only needed to
+build snapshots, or, with --baseline, if a stage got slower than --tolerance
+times its baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_pipeline import working_directory
+from benchmarks.synthetic import generate
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ('pandas', 'requests', 'pdfplumber')
+
+STAGES = ('import', 'load', 'process')
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import mouvement.server
+imported = time.perf_counter()
+mouvement.server.catalog.get()
+loaded = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'load_ms': (loaded - imported) * 1000,
+                  'heavy': [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def run_child(cwd, importtime=False):
+    """Output of one cold start, with the -X importtime report when asked"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(PROJECT_DIR), os.environ.get('PYTHONPATH')])))
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', CHILD]
+    start = time.perf_counter()
+    completed = subprocess.run(command, check=True, capture_output=True, text=True, cwd=cwd, env=env)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - start) * 1000
+    return result, completed.stderr
+
+
+def slowest_imports(report, count):
+    """The modules of a -X importtime report with the most cumulative time, in ms"""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def compare(results, baseline, tolerance):
+    """Print each stage against the baseline; returns the regressions"""
+    regressions = []
+    print("\nvs baseline")
+    for stage, timing in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before or not before['median_ms']:
+            continue
+        ratio = timing['median_ms'] / before['median_ms']
+        flag = '  SLOWER' if ratio > tolerance else ''
+        print(f"  {stage:<10} {before['median_ms']:10.1f} -> {timing['median_ms']:10.1f} ms  x{ratio:.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append((stage, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--top', type=int, default=15, help="Slowest imports listed")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare with the results of a previous run")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="Slowdown ratio over the baseline reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from mouvement.annuaire import load_annuaire
+    from mouvement.data import read_addresses, read_positions
+    from mouvement.snapshot import build_snapshot_data, write_snapshot
+
+    with tempfile.TemporaryDirectory(prefix='mouvement-bench-') as tmp, working_directory(tmp):
+        generate(tmp, args.rows, seed=args.seed)
+        write_snapshot(build_snapshot_data(positions=read_positions(), addresses=read_addresses(),
+                                           schools_dict=load_annuaire('fr-en-annuaire-education.json')))
+
+        runs = [run_child(tmp)[0] for _ in range(args.repeat)]
+        traced, report = run_child(tmp, importtime=True)
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'rows': args.rows,
+        'repeat': args.repeat,
+        'stages': {},
+        'heavy_modules': traced['heavy'],
+        'slowest_imports': slowest_imports(report, args.top),
+    }
+    print(f"{args.rows} rows, {args.repeat} cold starts")
+    for stage in STAGES:
+        timings = [run[f'{stage}_ms'] for run in runs]
+        results['stages'][stage] = {'median_ms': round(statistics.median(timings), 3),
+                                    'min_ms': round(min(timings), 3)}
+        print(f"  {stage:<10} median {results['stages'][stage]['median_ms']:8.1f} ms"
+              f"   min {results['stages'][stage]['min_ms']:8.1f} ms")
+    print("\nSlowest imports (-X importtime, cumulative)")
+    for cumulative_ms, name in results['slowest_imports']:
+        print(f"  {cumulative_ms:8.1f} ms  {name}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"\nResults written to {args.output}")
+
+    failed = False
+    if traced['heavy']:
+        print(f"\nThe serving path imported {', '.join(traced['heavy'])}")
+        failed = True
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than x{args.tolerance} the baseline")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
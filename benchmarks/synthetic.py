@@ -0,0 +1,215 @@
+"""
+Synthetic datasets shaped like the real inputs, at any size.
+
+    python -m benchmarks.synthetic --rows 10000 --output-dir /tmp/mouvement-10k
+
+Writes, in the output directory:
+
+- mouvement_complet_clean.csv: the positions, without header, as extracted from the PDF
+- fr-en-annuaire-education.json: an annuaire export (JSON array) with the
+  referenced schools plus unrelated ones, like the national file
+- schools_with_addresses.csv: the positions joined to the annuaire by school_addresses
+- REP_Toulouse.csv: about one school in ten
+
+UAIs have a département prefix from the académie and a valid check letter,
+communes repeat with a long-tail distribution, a few schools share a building
+and a few are missing from the annuaire or have no coordinates.
+"""
+import argparse
+import csv
+import json
+import random
+from pathlib import Path
+
+import pandas as pd
+
+# Départements of the académie de Toulouse
+DEPARTEMENTS = ['009', '012', '031', '032', '046', '065', '081', '082']
+
+# Check letter of a UAI: its 7 digits modulo 23 in this alphabet
+UAI_KEYS = 'ABCDEFGHJKLMNPRSTUVWXYZ'
+
+COMMUNES = [
+    ('Toulouse', '31000', 43.6045, 1.4440), ('Colomiers', '31770', 43.6112, 1.3350),
+    ('Tournefeuille', '31170', 43.5853, 1.3447), ('Blagnac', '31700', 43.6370, 1.3900),
+    ('Muret', '31600', 43.4614, 1.3266), ('Montauban', '82000', 44.0176, 1.3550),
+    ('Albi', '81000', 43.9289, 2.1464), ('Castres', '81100', 43.6060, 2.2410),
+    ('Rodez', '12000', 44.3506, 2.5750), ('Tarbes', '65000', 43.2328, 0.0781),
+    ('Auch', '32000', 43.6465, 0.5855), ('Cahors', '46000', 44.4475, 1.4419),
+    ('Foix', '09000', 42.9653, 1.6072), ('Pamiers', '09100', 43.1164, 1.6108),
+    ('Balma', '31130', 43.6110, 1.4994), ('Saint-Gaudens', '31800', 43.1081, 0.7234),
+]
+
+SCHOOL_KINDS = [
+    ('Ecole Maternelle Publique', 'Ecole'),
+    ('Ecole Elementaire Publique', 'Ecole'),
+    ('Ecole Primaire Publique', 'Ecole'),
+    ('Ecole Elementaire Application', 'Ecole'),
+]
+
+SCHOOL_NAMES = ['Jules Ferry', 'Jean Jaures', 'Victor Hugo', 'Pierre et Marie Curie',
+                'Jean Moulin', 'Jacques Prevert', 'Louise Michel', 'Marcel Pagnol',
+                'Les Tilleuls', 'Le Petit Prince', 'Condorcet', 'Ricardie']
+
+NATURES = [
+    ('Enseignant classepréélémentaire', 'Sans spécialité', 44),
+    ('Enseignant classeélémentaire', 'Sans spécialité', 40),
+    ('Compensationdécharge dedirecteur', 'Sans spécialité', 17),
+    ('Directeur écoleélémentaire', '5 classes', 3),
+    ('Directeur écolematernelle', '3 classes', 2),
+    ('Enseignant classeélémentaire', 'Anglais', 2),
+    ('Enseignant ULIS école', 'ULIS', 1),
+    ('Enseignant classeélémentaire', 'Occitan', 1),
+]
+
+
+def uai_code(departement, number):
+    """A UAI such as 0310160F: département, 4 digits and the check letter"""
+    digits = f"{departement}{number:04d}"
+    return digits + UAI_KEYS[int(digits) % len(UAI_KEYS)]
+
+
+def make_communes(count, rng):
+    """(name, postal code, lat, lon) of the communes, real ones first"""
+    communes = list(COMMUNES[:count])
+    for i in range(len(communes), count):
+        lat = rng.uniform(42.8, 44.8)
+        lon = rng.uniform(0.0, 2.9)
+        communes.append((f"Commune {i:04d}", f"{rng.choice(DEPARTEMENTS)[1:]}{rng.randrange(1000):03d}", lat, lon))
+    return communes
+
+
+def make_schools(count, communes, rng):
+    """One dict per school, with its UAI, name, commune and coordinates"""
+    # Long tail: a few big communes hold most schools
+    weights = [1 / (rank + 1) for rank in range(len(communes))]
+    if count > len(DEPARTEMENTS) * 10000:
+        raise ValueError(f"At most {len(DEPARTEMENTS) * 10000} distinct UAIs in the académie")
+    uais = set()
+    schools = []
+    building = None
+    while len(schools) < count:
+        uai = uai_code(rng.choice(DEPARTEMENTS), rng.randrange(10000))
+        if uai in uais:
+            continue
+        uais.add(uai)
+        commune, postal_code, lat, lon = rng.choices(communes, weights)[0]
+        kind, school_type = rng.choice(SCHOOL_KINDS)
+        if building and rng.random() < 0.1:
+            # Maternelle and élémentaire in the same building
+            lat, lon = building
+        else:
+            lat, lon = round(lat + rng.gauss(0, 0.03), 6), round(lon + rng.gauss(0, 0.03), 6)
+        building = (lat, lon)
+        has_coords = rng.random() > 0.02
+        schools.append({
+            'uai': uai,
+            'name': f"{kind} {rng.choice(SCHOOL_NAMES)} {len(schools) % 7 + 1}",
+            'commune': commune,
+            'postal_code': postal_code,
+            'type': school_type,
+            'latitude': lat if has_coords else None,
+            'longitude': lon if has_coords else None,
+            'street': f"{rng.randrange(1, 200)} rue {rng.choice(SCHOOL_NAMES)}",
+        })
+    return schools
+
+
+def school_label(school, rng):
+    """The 'Etablissement' cell, in the formats found in the PDF"""
+    if rng.random() < 0.9:
+        return f"{school['name']}({school['uai'].lower()})"
+    return f"{school['name']} ({school['uai'].lower()}) E"
+
+
+def positions_frame(rows, schools, rng):
+    """The header-less positions table of mouvement_complet_clean.csv"""
+    nature_weights = [weight for _, _, weight in NATURES]
+    records = []
+    for i in range(rows):
+        # Every school gets at least one position, the rest are spread at random
+        school = schools[i] if i < len(schools) else rng.choice(schools)
+        nature, specialization, _ = rng.choices(NATURES, nature_weights)[0]
+        vacant = 1 if rng.random() < 0.15 else 0
+        records.append([rng.randrange(1, 200000), school['commune'], school_label(school, rng), 'E',
+                        nature, specialization, vacant, rng.randrange(0, 9)])
+    return pd.DataFrame(records)
+
+
+def annuaire_record(school):
+    return {
+        'identifiant_de_l_etablissement': school['uai'],
+        'nom_etablissement': school['name'],
+        'type_etablissement': school['type'],
+        'adresse_1': school['street'],
+        'adresse_2': None,
+        'adresse_3': f"{school['postal_code']} {school['commune'].upper()}",
+        'code_postal': school['postal_code'],
+        'nom_commune': school['commune'],
+        'code_departement': school['uai'][:3],
+        'latitude': school['latitude'],
+        'longitude': school['longitude'],
+        'date_maj_ligne': '2025-04-01',
+    }
+
+
+def generate(output_dir, rows, seed=0):
+    """Write a dataset of `rows` positions to output_dir; returns the paths by name"""
+    from mouvement.annuaire import convert_record
+    from school_addresses import COLUMNS, resolve_addresses
+
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    communes = make_communes(max(len(COMMUNES), rows // 200), rng)
+    schools = make_schools(max(1, rows // 3), communes, rng)
+    positions = positions_frame(rows, schools, rng)
+
+    paths = {
+        'positions': output_dir / 'mouvement_complet_clean.csv',
+        'annuaire': output_dir / 'fr-en-annuaire-education.json',
+        'addresses': output_dir / 'schools_with_addresses.csv',
+        'rep': output_dir / 'REP_Toulouse.csv',
+    }
+    positions.to_csv(paths['positions'], sep=';', header=False, index=False, encoding='utf-8')
+
+    # 1% of the schools are missing from the annuaire, which also lists as many unrelated schools
+    listed = [school for school in schools if rng.random() > 0.01]
+    others = make_schools(len(schools), communes, random.Random(seed + 1))
+    known = {school['uai'] for school in schools}
+    records = [annuaire_record(s) for s in listed] + [annuaire_record(s) for s in others if s['uai'] not in known]
+    rng.shuffle(records)
+    with open(paths['annuaire'], 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+
+    addresses = positions.copy()
+    addresses.columns = COLUMNS
+    schools_dict = dict(convert_record(annuaire_record(school)) for school in listed)
+    resolve_addresses(addresses, schools_dict)
+    addresses.to_csv(paths['addresses'], sep=';', index=False, encoding='utf-8')
+
+    with open(paths['rep'], 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['RNE', 'SIGLE', 'NOM', 'CP', 'COMMUNE', 'Plan violence', 'REP+ (2014)', 'REP/REP+ (2015)'])
+        for school in schools:
+            if rng.random() < 0.1:
+                writer.writerow([school['uai'], 'EEPU', school['name'].upper(), school['postal_code'],
+                                 school['commune'].upper(), 'X', '', rng.choice(['REP', 'REP+'])])
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic mouvement dataset")
+    parser.add_argument('--rows', type=int, default=10_000, help="Number of positions (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', required=True)
+    args = parser.parse_args()
+
+    for name, path in generate(args.output_dir, args.rows, seed=args.seed).items():
+        print(f"{name:<10} {path}")
+
+
+if __name__ == '__main__':
+    main()
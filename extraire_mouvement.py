@@ -1,49 +1,134 @@
+import argparse
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
 import camelot
 import pandas as pd
 import re
 
+# Options shared by the serial and the parallel extraction
+READ_OPTIONS = {
+    'flavor': 'lattice',
+    'strip_text': '\n',
+    'suppress_stdout': True,
+}
+
 def clean_etablissement(text):
     """Clean school names while preserving institution codes"""
     return re.sub(r'\s+', ' ', text).strip()
 
-def process_pdf_to_csv(pdf_path, csv_path):
+def read_tables(pdf_path):
+    """Extract the tables of every page in one process"""
     # Extract tables using lattice mode (best for bordered LaTeX tables)
-    tables = camelot.read_pdf(
-        pdf_path,
-        pages='all',
-        flavor='lattice',
-        strip_text='\n',
-        suppress_stdout=True
-    )
-    
+    tables = camelot.read_pdf(pdf_path, pages='all', **READ_OPTIONS)
+    return [table.df for table in tables]
+
+def pdf_sha256(pdf_path):
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_pages(pdf_path, pages):
+    """Extract the tables of some pages; returns {page: [DataFrame, ...]} in page order"""
+    tables = camelot.read_pdf(pdf_path, pages=','.join(map(str, pages)), **READ_OPTIONS)
+    result = {page: [] for page in pages}
+    for table in tables:
+        result[int(table.page)].append(table.df)
+    return result
+
+def read_tables_parallel(pdf_path, workers=None, cache_dir=None, chunk_size=2):
+    """
+    Extract the tables with page ranges spread over a process pool, merged back
+    in page order. With a cache_dir, each page's tables are stored under the PDF
+    hash and pages already parsed are not extracted again.
+    """
+    from camelot.handlers import PDFHandler
+    pages = PDFHandler(pdf_path, pages='all').pages
+
+    results = {}
+    page_cache = None
+    if cache_dir is not None:
+        page_cache = Path(cache_dir) / pdf_sha256(pdf_path)
+        page_cache.mkdir(parents=True, exist_ok=True)
+        for page in pages:
+            cached = page_cache / f'page-{page:04d}.pkl'
+            if cached.exists():
+                with open(cached, 'rb') as f:
+                    results[page] = pickle.load(f)
+
+    missing = [page for page in pages if page not in results]
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    print(f"Extracting {len(missing)} of {len(pages)} pages in {len(chunks)} chunks")
+
+    if chunks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_result in executor.map(extract_pages, repeat(pdf_path), chunks):
+                for page, frames in chunk_result.items():
+                    results[page] = frames
+                    if page_cache is not None:
+                        tmp = page_cache / f'page-{page:04d}.tmp'
+                        with open(tmp, 'wb') as f:
+                            pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        os.replace(tmp, page_cache / f'page-{page:04d}.pkl')
+
+    return [frame for page in pages for frame in results[page]]
+
+def tables_to_dataframe(frames):
     # Combine all tables into one DataFrame
-    df = pd.concat([table.df for table in tables], ignore_index=True)
-    
+    df = pd.concat(frames, ignore_index=True)
+
     # Clean headers from multi-line fragments
     df.columns = [
         "Rang", "Numéro du poste", "Commune", "Etablissement",
         "Type de poste", "Nature de support", "Spécialité / Nb classes",
         "Nb de postes vacants", "Nb de postes susceptibles d'être vacants"
     ]
-    
+
     # Remove duplicate header rows
     df = df[df['Rang'] != 'Rang'].reset_index(drop=True)
-    
+
     # Clean data
     df['Etablissement'] = df['Etablissement'].apply(clean_etablissement)
     df['Type de poste'] = 'E'  # All values are 'E' based on the document
-    
+
     # Convert numerical columns to integers
     int_cols = ['Rang', 'Nb de postes vacants', 'Nb de postes susceptibles d\'être vacants']
     df[int_cols] = df[int_cols].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
-    
+    return df
+
+def extract_mouvement(pdf_path, workers=1, cache_dir=None):
+    """
+    Extract the mouvement table from the PDF. workers=1 without a cache runs
+    camelot once on all pages; otherwise pages are extracted in parallel
+    (workers=None uses every CPU). Both give the same DataFrame.
+    """
+    if workers == 1 and cache_dir is None:
+        frames = read_tables(pdf_path)
+    else:
+        frames = read_tables_parallel(pdf_path, workers=workers, cache_dir=cache_dir)
+    return tables_to_dataframe(frames)
+
+def process_pdf_to_csv(pdf_path, csv_path, workers=1, cache_dir=None):
+    df = extract_mouvement(pdf_path, workers=workers, cache_dir=cache_dir)
+
     # Save to CSV
     df.to_csv(csv_path, index=False, encoding='utf-8-sig')
     print(f"Successfully exported {len(df)} rows to {csv_path}")
 
 if __name__ == "__main__":
-    input_pdf = "Celia-Voeu-Groupe-51822-April-18-2025.pdf"
-    output_csv = "mouvement_complet.csv"
-    process_pdf_to_csv(input_pdf, output_csv)
-
-
+    parser = argparse.ArgumentParser(description="Extract the mouvement table from the PDF to CSV")
+    parser.add_argument('input_pdf', nargs='?', default="Celia-Voeu-Groupe-51822-April-18-2025.pdf")
+    parser.add_argument('output_csv', nargs='?', default="mouvement_complet.csv")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to extract pages in parallel (0: one per CPU, default: %(default)s)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Keep each parsed page here, keyed by the PDF hash, and skip it on re-runs")
+    args = parser.parse_args()
+    process_pdf_to_csv(args.input_pdf, args.output_csv,
+                       workers=args.workers or None, cache_dir=args.cache_dir)
@@ -0,0 +1,188 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    """Character buffer over a text stream, refilled on demand"""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read one more chunk, dropping what has already been consumed"""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the annuaire stream")
+        self.pos += 1
+
+    def decode(self, decoder):
+        """Decode the next JSON value, reading more input until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_array(reader, decoder):
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        yield reader.decode(decoder)
+        char = reader.peek()
+        reader.pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError(f"Unexpected {char!r} in annuaire array")
+
+
+def iter_annuaire_records(fp, chunk_size=CHUNK_SIZE):
+    """
+    Yield the records of an annuaire export one at a time, without loading the
+    whole file. Accepts the JSON export (a top-level array of records) and the
+    GeoJSON export (records are the 'properties' of each feature).
+    """
+    decoder = json.JSONDecoder()
+    reader = _Reader(fp, chunk_size)
+
+    if reader.peek() == '[':
+        yield from _iter_array(reader, decoder)
+        return
+
+    # GeoJSON: walk the top-level keys until we reach 'features'
+    reader.expect('{')
+    while reader.peek() != '}':
+        key = reader.decode(decoder)
+        reader.expect(':')
+        if key == 'features':
+            for feature in _iter_array(reader, decoder):
+                yield feature.get('properties') or {}
+        else:
+            reader.decode(decoder)
+        if reader.peek() == ',':
+            reader.pos += 1
+
+
+def _departement_code(value):
+    return str(value or '').strip().upper().lstrip('0')
+
+
+def convert_record(record):
+    """
+    Convert an annuaire record to our format. Returns (uai, school) or None if
+    the record has no UAI.
+    """
+    uai = record.get('identifiant_de_l_etablissement')
+    if not uai:
+        return None
+
+    # Combine address fields, handling None values
+    address_parts = []
+    for i in range(1, 4):
+        addr = record.get(f'adresse_{i}')
+        if addr and addr != 'None':
+            address_parts.append(addr)
+
+    # Get and validate coordinates
+    try:
+        lat = float(record.get('latitude', ''))
+        lon = float(record.get('longitude', ''))
+        # Basic validation of coordinates for France
+        if not (41 <= lat <= 52 and -5 <= lon <= 10):
+            lat, lon = None, None
+    except (ValueError, TypeError):
+        lat, lon = None, None
+
+    # Convert UAI to uppercase for consistency
+    return uai.upper(), {
+        'address': ' '.join(address_parts),
+        'postal_code': record.get('code_postal', ''),
+        'commune': record.get('nom_commune', ''),
+        'type': record.get('type_etablissement', ''),
+        'name': record.get('nom_etablissement', ''),
+        'latitude': lat,
+        'longitude': lon
+    }
+
+
+def load_annuaire(source, uais=None, departement=None, info=None):
+    """
+    Stream an annuaire export (path or text file object) into a UAI -> school dict.
+
+    Only the records we need are converted and kept: those whose UAI is in
+    `uais` (if given) and whose département matches `departement` (if given,
+    e.g. '31' or '031'). With no filter, every school is kept.
+
+    If an `info` dict is given, it is filled with the number of records scanned
+    and the most recent 'date_maj_ligne' seen, which is used for delta updates.
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'r', encoding='utf-8') as f:
+            return load_annuaire(f, uais=uais, departement=departement, info=info)
+
+    wanted = {uai.upper() for uai in uais} if uais is not None else None
+    wanted_departement = _departement_code(departement) if departement else None
+
+    schools_dict = {}
+    scanned = 0
+    latest_update = None
+    for record in iter_annuaire_records(source):
+        scanned += 1
+        updated = record.get('date_maj_ligne')
+        if updated and (latest_update is None or updated > latest_update):
+            latest_update = updated
+        uai = record.get('identifiant_de_l_etablissement')
+        if not uai:
+            continue
+        if wanted is not None and uai.upper() not in wanted:
+            continue
+        if wanted_departement and _departement_code(record.get('code_departement')) != wanted_departement:
+            continue
+        converted = convert_record(record)
+        schools_dict[converted[0]] = converted[1]
+
+    if info is not None:
+        info.update(scanned=scanned, latest_update=latest_update)
+    logger.info(f"Kept {len(schools_dict)} of {scanned} annuaire records")
+    return schools_dict
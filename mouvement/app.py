@@ -1,284 +1,262 @@
-from flask import Flask, render_template
-import pandas as pd
-import json
-import os
-import re
+from flask import Flask, Response, abort, g, jsonify, make_response, render_template, request
+import cProfile
 import logging
-import urllib.parse
-import csv
-import requests
+import math
+import os
 import time
 from pathlib import Path
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+from mouvement import metrics
+from mouvement.catalog import Catalog
+from mouvement.facets import FACETS
+from mouvement.metrics import stage_timer
+from mouvement.nearest import MAX_ORIGINS, MAX_RESULTS
+from mouvement.payload import feature_collection, payload_response
+
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-def get_directions_url(destination_address):
+# Prebuilt data served from memory, one snapshot per dataset of the catalog,
+# see mouvement/snapshot.py and mouvement/catalog.py
+catalog = Catalog()
+
+# Map rendering mode, see templates/index.html; ?renderer= overrides it per page
+RENDERERS = ('markers', 'canvas')
+RENDERER = os.environ.get('MOUVEMENT_RENDERER', 'markers')
+
+# When set, a request with ?profile=1 is run under cProfile and its stats saved here
+PROFILE_DIR = os.environ.get('MOUVEMENT_PROFILE_DIR')
+
+def detail_cache_counts():
+    infos = [snapshot['detail_json'].cache_info() for snapshot in catalog.snapshots()]
+    return {('detail', 'hit'): sum(info.hits for info in infos),
+            ('detail', 'miss'): sum(info.misses for info in infos)}
+
+metrics.CACHE_REQUESTS.track(detail_cache_counts)
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    metrics.start_request()
+    if PROFILE_DIR and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def end_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        path = Path(PROFILE_DIR) / f"{time.time_ns() // 1_000_000}-{request.endpoint}.prof"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        response.headers['X-Profile'] = path.name
+        logger.info(f"Profile of {request.full_path} written to {path}")
+
+    elapsed = time.perf_counter() - g.started
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=response.status_code)
+    timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in metrics.end_request()]
+    response.headers['Server-Timing'] = ', '.join([*timings, f"total;dur={elapsed * 1000:.2f}"])
+    return response
+
+def current_snapshot():
+    """The snapshot of the ?dataset= of the request, the default dataset without it"""
+    dataset = request.args.get('dataset') or None
+    try:
+        return catalog.get(dataset)
+    except KeyError:
+        abort(make_response(jsonify(error=f"Unknown dataset {dataset}"), 404))
+    except FileNotFoundError:
+        abort(make_response(jsonify(error=f"Dataset {dataset} has not been built"), 404))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request latencies, stage timings and cache hit rates in the Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/healthz')
+def healthz():
+    """Readiness: 200 once a snapshot is loaded, 503 before; never loads one"""
+    versions = [snapshot['version'] for snapshot in catalog.snapshots()]
+    if not versions:
+        return jsonify(status='loading'), 503
+    return jsonify(status='ready', versions=versions)
+
+@app.route('/')
+def index():
+    snapshot = current_snapshot()
+    renderer = request.args.get('renderer', RENDERER)
+    if renderer not in RENDERERS:
+        renderer = 'markers'
+    with stage_timer('render'):
+        return render_template('index.html',
+                             stats=snapshot['stats'],
+                             bounds=snapshot['bounds'],
+                             renderer=renderer,
+                             dataset=catalog.resolve(request.args.get('dataset') or None),
+                             datasets=catalog.datasets()['datasets'],
+                             static_site=None,
+                             table_html=None)
+
+@app.route('/api/schools.geojson')
+def api_schools():
+    return payload_response(current_snapshot()['payloads']['schools'])
+
+@app.route('/api/rep.json')
+def api_rep():
+    return payload_response(current_snapshot()['payloads']['rep'])
+
+def parse_floats(value, count, name):
+    """Parse a comma-separated list of `count` finite floats from a query parameter"""
+    try:
+        values = [float(v) for v in value.split(',')]
+    except ValueError:
+        values = []
+    if len(values) != count or not all(math.isfinite(v) for v in values):
+        raise ValueError(f"{name} must be {count} comma-separated numbers")
+    return values
+
+def parse_bbox(value):
+    """Parse min_lon,min_lat,max_lon,max_lat; longitudes may go past ±180 when the map is zoomed out"""
+    bbox = parse_floats(value, 4, 'bbox')
+    if not (-90 <= bbox[1] <= 90 and -90 <= bbox[3] <= 90):
+        raise ValueError("bbox latitudes must be between -90 and 90")
+    return bbox
+
+def feature_collection_response(features):
+    """Assemble a FeatureCollection response from pre-serialized features"""
+    with stage_timer('serialization'):
+        body = feature_collection(features)
+    return Response(body, content_type='application/geo+json')
+
+@app.route('/api/schools')
+def api_schools_query():
     """
-    Generate a Google Maps directions URL for cycling from a fixed starting point
-    to the destination address.
+    Schools inside a bounding box (?bbox=min_lon,min_lat,max_lon,max_lat) or
+    within a radius of a point (?near=lat,lon&radius_km=5, nearest first)
     """
-    base_url = "https://www.google.com/maps/dir/"
-    start_address = "15 rue de la chaussée, 31000 toulouse"
-    
-    # URL encode the addresses
-    start_encoded = urllib.parse.quote(start_address)
-    dest_encoded = urllib.parse.quote(destination_address)
-    
-    # Add cycling mode parameter
-    return f"{base_url}{start_encoded}/{dest_encoded}/?mode=bicycling"
+    snapshot = current_snapshot()
+    spatial = snapshot['spatial']
+    try:
+        if 'bbox' in request.args:
+            ids = spatial.query_bbox(*parse_bbox(request.args['bbox']))
+        elif 'near' in request.args:
+            lat, lon = parse_floats(request.args['near'], 2, 'near')
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("near must be a valid latitude,longitude")
+            radius_km = parse_floats(request.args.get('radius_km', '5'), 1, 'radius_km')[0]
+            ids = spatial.query_radius(lat, lon, radius_km)
+        else:
+            return jsonify(error="Expected a bbox or near parameter"), 400
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    feature_json = snapshot['model'].feature_json
+    return feature_collection_response(feature_json(i) for i in ids)
 
-def download_schools_data():
+@app.route('/api/schools/<uai>')
+def api_school_detail(uai):
+    """Full details and positions of one school, fetched when its popup opens"""
+    body = current_snapshot()['detail_json'](uai.upper())
+    if body is None:
+        return jsonify(error=f"Unknown school {uai}"), 404
+    return Response(body, content_type='application/json')
+
+@app.route('/api/clusters')
+def api_clusters():
     """
-    Download schools data from the education.gouv.fr API and convert it to our format
+    Clusters visible at a zoom level (?z=12&bbox=min_lon,min_lat,max_lon,max_lat).
+    Clusters carry point_count and summed vacancies; single locations are full features.
     """
-    cache_file = Path('schools_data_cache.json')
-    cache_duration = 24 * 60 * 60  # 24 hours in seconds
-    
-    # Check if we have a valid cache
-    if cache_file.exists():
-        cache_age = time.time() - cache_file.stat().st_mtime
-        if cache_age < cache_duration:
-            logger.info("Using cached schools data")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    
-    logger.info("Downloading fresh schools data from API")
+    snapshot = current_snapshot()
     try:
-        # Download data from API
-        url = "https://data.education.gouv.fr/api/explore/v2.1/catalog/datasets/fr-en-annuaire-education/exports/json?lang=fr&timezone=Europe%2FBerlin"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Convert to our format
-        schools_dict = {}
-        for school in data:
-            uai = school.get('identifiant_de_l_etablissement')
-            if uai:
-                # Convert UAI to uppercase for consistency
-                uai = uai.upper()
-                # Combine address fields, handling None values
-                address_parts = []
-                for i in range(1, 4):
-                    addr = school.get(f'adresse_{i}')
-                    if addr and addr != 'None':
-                        address_parts.append(addr)
-                
-                # Get and validate coordinates
-                try:
-                    lat = float(school.get('latitude', ''))
-                    lon = float(school.get('longitude', ''))
-                    # Basic validation of coordinates for France
-                    if not (41 <= lat <= 52 and -5 <= lon <= 10):
-                        lat, lon = None, None
-                except (ValueError, TypeError):
-                    lat, lon = None, None
-                
-                schools_dict[uai] = {
-                    'address': ' '.join(address_parts),
-                    'postal_code': school.get('code_postal', ''),
-                    'commune': school.get('nom_commune', ''),
-                    'type': school.get('type_etablissement', ''),
-                    'name': school.get('nom_etablissement', ''),
-                    'latitude': lat,
-                    'longitude': lon
-                }
-        
-        # Save to cache
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(schools_dict, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"Downloaded and processed {len(schools_dict)} schools")
-        return schools_dict
-        
-    except Exception as e:
-        logger.error(f"Error downloading schools data: {str(e)}")
-        # If we have a cache file, use it even if it's old
-        if cache_file.exists():
-            logger.info("Using old cache due to download error")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-
-def load_schools():
+        zoom = int(request.args.get('z', ''))
+    except ValueError:
+        return jsonify(error="z must be an integer zoom level"), 400
     try:
-        # Read the CSV file with the correct headers
-        headers = [
-            "Numéro du poste", "Commune", "Etablissement", "Type de poste",
-            "Nature de support", "Spécialité / Nb classes",
-            "Nb de postes vacants", "Nb de postes susceptibles d'être vacants"
-        ]
-        
-        logger.debug("Attempting to read mouvement_complet_clean.csv")
-        # First read the original CSV to get the list data
-        df_list = pd.read_csv('mouvement_complet_clean.csv', sep=';', encoding='utf-8', header=None)
-        df_list.columns = headers
-        logger.debug(f"Successfully loaded mouvement_complet_clean.csv with {len(df_list)} rows")
-        
-        logger.debug("Attempting to read schools_with_addresses.csv")
-        # Then read the CSV with addresses and coordinates
-        df = pd.read_csv('schools_with_addresses.csv', sep=';', encoding='utf-8')
-        logger.debug(f"Successfully loaded schools_with_addresses.csv with {len(df)} rows")
-        
-        # Download schools data from API
-        schools_dict = download_schools_data()
-        
-        # Convert DataFrame to list of dictionaries
-        schools = df.to_dict('records')
-        
-        # Convert to GeoJSON format for the map
-        geojson = {
-            "type": "FeatureCollection",
-            "features": []
-        }
-        
-        # Statistics tracking
-        stats = {
-            'total': len(schools),
-            'found': 0,
-            'not_found': 0,
-            'error': 0
-        }
-        
-        # Create a dictionary to group schools by coordinates
-        location_groups = {}
-        
-        total_schools = len(schools)
-        processed = 0
-        
-        for school in schools:
-            processed += 1
-            logger.debug(f"Processing school {processed}/{total_schools}: {school['school_name']}")
-            
-            try:
-                # Extract UAI code from school name
-                uai_match = re.search(r'\(([0-9A-Za-z]+)\)', school['school_name'])
-                if uai_match:
-                    uai = uai_match.group(1).upper()
-                    
-                    # Get school data from API data
-                    school_data = schools_dict.get(uai)
-                    if school_data and school_data['latitude'] is not None and school_data['longitude'] is not None:
-                        # Create a unique key for this school's location
-                        coord_key = (float(school_data['latitude']), float(school_data['longitude']))
-                        
-                        # Initialize the location group if it doesn't exist
-                        if coord_key not in location_groups:
-                            location_groups[coord_key] = {
-                                'coordinates': [float(school_data['longitude']), float(school_data['latitude'])],
-                                'schools': []
-                            }
-                        
-                        # Find all corresponding rows in df_list for this school
-                        school_rows = df_list[df_list['Etablissement'].str.contains(uai, na=False)]
-                        
-                        # Create a list to store all positions for this school
-                        positions = []
-                        
-                        # Process each position for this school
-                        for _, row in school_rows.iterrows():
-                            # Calculate the ratio
-                            vacants = row['Nb de postes vacants']
-                            susceptibles = row["Nb de postes susceptibles d'être vacants"]
-                            total = vacants + susceptibles
-                            ratio = f"{vacants}/{total}" if total > 0 else "N/A"
-                            
-                            # Add position details
-                            positions.append({
-                                "type": row['Type de poste'],
-                                "specialization": row['Nature de support'],
-                                "ratio": ratio
-                            })
-                        
-                        # Add school to the location group with all its positions
-                        location_groups[coord_key]['schools'].append({
-                            "name": school['school_name'],
-                            "city": school_data['commune'],
-                            "address": school_data['address'],
-                            "positions": positions,
-                            "directions_url": get_directions_url(school_data['address'])
-                        })
-                        stats['found'] += 1
-                    else:
-                        logger.debug(f"No coordinates found for school: {school['school_name']}")
-                        stats['not_found'] += 1
-                else:
-                    logger.debug(f"No UAI code found for school: {school['school_name']}")
-                    stats['not_found'] += 1
-            except Exception as e:
-                logger.error(f"Error processing school {school['school_name']}: {str(e)}")
-                stats['error'] += 1
-        
-        # Create GeoJSON features from location groups
-        for coord_key, group in location_groups.items():
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": group['coordinates']
-                },
-                "properties": {
-                    "schools": group['schools']
-                }
-            }
-            geojson["features"].append(feature)
-        
-        # Print statistics
-        logger.info("\nSchool Processing Statistics:")
-        logger.info(f"Total schools: {stats['total']}")
-        logger.info(f"Schools with coordinates: {stats['found']}")
-        logger.info(f"Schools without coordinates: {stats['not_found']}")
-        logger.info(f"Errors: {stats['error']}")
-        
-        return geojson, stats, None
-        
-    except Exception as e:
-        logger.error(f"Error loading schools data: {str(e)}")
-        return {"type": "FeatureCollection", "features": []}, {"total": 0, "found": 0, "not_found": 0, "error": 1}, None
+        features = snapshot['clusters'].query(zoom, *parse_bbox(request.args.get('bbox', '')))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return feature_collection_response(features)
+
+def parse_flag(name):
+    """A 0/1 query parameter as a bool, or None if absent"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    if value not in ('0', '1'):
+        raise ValueError(f"{name} must be 0 or 1")
+    return value == '1'
 
-def load_rep_schools():
-    """Load the list of REP schools from REP_Toulouse.csv"""
+@app.route('/api/nearest')
+def api_nearest():
+    """
+    The n nearest locations with vacant posts from one or more origins
+    (?origin=lat,lon&origin=lat,lon&n=10). vacant=0 includes every location,
+    rep=1 or rep=0 keeps only REP or non-REP ones.
+    """
+    snapshot = current_snapshot()
     try:
-        rep_schools = []
-        
-        # Try different encodings
-        encodings = ['utf-8', 'latin1']
-        for encoding in encodings:
-            try:
-                with open('REP_Toulouse.csv', 'r', encoding=encoding) as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        rne = row.get('RNE', '').strip().upper()
-                        if rne:  # Only add non-empty RNE codes
-                            rep_schools.append(rne)
-                break  # If we successfully read the file, break the loop
-            except UnicodeDecodeError:
-                continue
-        
-        # Log details about the processing
-        logger.info(f"Total number of RNE codes: {len(rep_schools)}")
-        logger.info("All RNE codes:")
-        for code in rep_schools:
-            logger.info(f"  {code}")
-        
-        return rep_schools
-    except Exception as e:
-        logger.error(f"Error loading REP schools: {str(e)}")
-        return []
+        origins = [parse_floats(value, 2, 'origin') for value in request.args.getlist('origin')]
+        if not origins:
+            raise ValueError("Expected at least one origin=lat,lon parameter")
+        if len(origins) > MAX_ORIGINS:
+            raise ValueError(f"At most {MAX_ORIGINS} origins are allowed")
+        if any(not (-90 <= lat <= 90 and -180 <= lon <= 180) for lat, lon in origins):
+            raise ValueError("origin must be a valid latitude,longitude")
+        n = request.args.get('n', '10')
+        n = int(n) if n.isdigit() else 0
+        if not 1 <= n <= MAX_RESULTS:
+            raise ValueError(f"n must be between 1 and {MAX_RESULTS}")
+        vacant = parse_flag('vacant')
+        rep = parse_flag('rep')
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-@app.route('/')
-def index():
-    schools, stats, table_html = load_schools()
-    rep_schools = load_rep_schools()
-    return render_template('index.html', 
-                         schools=json.dumps(schools),
-                         stats=stats,
-                         table_html=table_html,
-                         rep_schools=json.dumps(rep_schools))
+    results = snapshot['nearest'].query(origins, n=n, vacant=vacant is not False, rep=rep)
+    feature_json = snapshot['model'].feature_json
+    with stage_timer('serialization'):
+        body = '{"results":[' + ','.join(
+            '{"origin":[%r,%r],"locations":[%s]}' % (lat, lon, ','.join(
+                '{"distance_km":%.3f,"feature":%s}' % (distance, feature_json(i)) for distance, i in matches))
+            for (lat, lon), matches in zip(origins, results)) + ']}'
+    return Response(body, content_type='application/json')
+
+@app.route('/api/search')
+def api_search():
+    """
+    Posts matching facet filters, e.g. ?commune=Toulouse&rep=REP%2B&vacant=1.
+    Repeat a parameter to accept several values. Returns the ids of the
+    locations, the number of posts and the post counts of every facet value.
+    """
+    filters = {facet: request.args.getlist(facet) for facet in FACETS if facet in request.args}
+    ids, posts, counts = current_snapshot()['facets'].search(filters)
+    with stage_timer('serialization'):
+        return jsonify(ids=ids, posts=posts, facets=counts)
+
+@app.route('/api/datasets')
+def api_datasets():
+    """The datasets of the catalog (id, label, year, group) and the default one"""
+    return jsonify(catalog.datasets())
+
+@app.route('/api/diff')
+def api_diff():
+    """
+    Posts that appeared, disappeared or changed vacancy counts between two
+    datasets (?from=2024-51822&to=2025-51822), precomputed by python -m mouvement.catalog
+    """
+    from_id, to_id = request.args.get('from'), request.args.get('to')
+    if not from_id or not to_id or from_id == to_id:
+        return jsonify(error="Expected two different datasets as from and to parameters"), 400
+    try:
+        payload = catalog.diff(from_id, to_id)
+    except KeyError as e:
+        return jsonify(error=f"Unknown dataset {e.args[0]}"), 404
+    except FileNotFoundError:
+        return jsonify(error=f"No diff from {from_id} to {to_id}, build it with python -m mouvement.catalog"), 404
+    return payload_response(payload)
 
 if __name__ == '__main__':
-    app.run(debug=True) 
+    logging.basicConfig(level=logging.DEBUG)
+    app.run(debug=True)
@@ -0,0 +1,329 @@
+"""
+Catalog of the datasets served side by side: several years and vœu groups.
+
+    python -m mouvement.catalog [--catalog datasets.json] [--annuaire FILE]
+
+The catalog file lists the datasets, oldest first, and the one served by default:
+
+    {
+      "default": "2025-51822",
+      "datasets": [
+        {"id": "2025-51822", "label": "2025, groupe 51822", "year": 2025, "group": "51822",
+         "positions": "mouvement_complet_clean.csv", "addresses": "schools_with_addresses.csv"}
+      ]
+    }
+
+`rep` optionally names the REP list of a dataset (REP_Toulouse.csv by default).
+The command builds the snapshot of every dataset in snapshots/<id>/ and the
+diff of every pair of datasets in snapshots/<from>/diffs/<to>.json: the posts
+that appeared, disappeared or whose vacancy counts changed.
+
+The app loads a dataset on its first request and keeps the loaded datasets and
+diffs in an LRU bounded by their estimated memory.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from mouvement.facets import UAI_PATTERN
+from mouvement.metrics import cache_hit, cache_miss
+from mouvement.payload import make_payload
+from mouvement.snapshot import SNAPSHOT_DIR, SnapshotStore, build_snapshot_data, file_sha256, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = Path(os.environ.get('MOUVEMENT_CATALOG', 'datasets.json'))
+
+# Memory allowed for the loaded datasets and diffs
+MAX_BYTES = int(os.environ.get('MOUVEMENT_CATALOG_MEMORY_MB', '512')) * 1024 * 1024
+
+# Memory of a loaded snapshot per byte of its packed file: the mapped arrays
+# plus the indexes built from them (measured with benchmarks/bench_memory.py)
+MEMORY_FACTOR = 1.5
+
+DATASET_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+POST_FIELDS = ['code', 'uai', 'school', 'commune', 'nature', 'specialite', 'vacants', 'susceptibles']
+
+
+def read_catalog(path=CATALOG_FILE):
+    """The default dataset id and the datasets of a catalog file, by id in file order"""
+    with open(path, 'r', encoding='utf-8') as f:
+        catalog = json.load(f)
+    datasets = {}
+    for entry in catalog.get('datasets', []):
+        dataset_id = str(entry.get('id', ''))
+        if not DATASET_ID.match(dataset_id):
+            raise ValueError(f"Invalid dataset id {dataset_id!r} in {path}")
+        if dataset_id in datasets:
+            raise ValueError(f"Duplicate dataset id {dataset_id} in {path}")
+        for key in ('positions', 'addresses'):
+            if not entry.get(key):
+                raise ValueError(f"Dataset {dataset_id} in {path} has no {key} file")
+        datasets[dataset_id] = entry
+    default = catalog.get('default') or next(iter(datasets), None)
+    if default is not None and default not in datasets:
+        raise ValueError(f"Default dataset {default} is not in {path}")
+    return {'default': default, 'datasets': datasets}
+
+
+def diff_path(snapshot_dir, from_id, to_id):
+    return Path(snapshot_dir) / from_id / 'diffs' / f'{to_id}.json'
+
+
+def diff_etag(diff):
+    """
+    ETag of a diff: the posts come from the positions files, whose vacancy
+    counts the snapshot versions do not cover, so their hashes are part of it
+    """
+    return (f"{diff['from_version']}-{diff['to_version']}-"
+            f"{(diff.get('from_positions') or '')[:16]}-{(diff.get('to_positions') or '')[:16]}-diff")
+
+
+def post_table(positions):
+    """
+    The posts of a positions table (as read from mouvement_complet_clean.csv),
+    indexed by post number and UAI. Counts of duplicate rows are summed.
+    """
+    import pandas as pd
+
+    def text(column):
+        return positions[column].fillna('').astype(str).str.strip()
+
+    posts = pd.DataFrame({
+        'code': text(0),
+        'uai': positions[2].str.extract(UAI_PATTERN, expand=False).str.upper().fillna(''),
+        'school': text(2),
+        'commune': text(1),
+        'nature': text(4),
+        'specialite': text(5),
+        'vacants': pd.to_numeric(positions[6], errors='coerce').fillna(0).astype(int),
+        'susceptibles': pd.to_numeric(positions[7], errors='coerce').fillna(0).astype(int),
+    })
+    return posts.groupby(['code', 'uai'], sort=True).agg({
+        'school': 'first', 'commune': 'first', 'nature': 'first', 'specialite': 'first',
+        'vacants': 'sum', 'susceptibles': 'sum',
+    })
+
+
+def diff_posts(before, after):
+    """
+    Posts of `after` missing from `before` (appeared), of `before` missing from
+    `after` (disappeared) and in both with other vacancy counts (changed), from
+    two post_table() results
+    """
+    def records(frame):
+        return frame.reset_index()[POST_FIELDS].to_dict('records')
+
+    common = before.index.intersection(after.index)
+    old, new = before.loc[common], after.loc[common]
+    moved = (old['vacants'] != new['vacants']) | (old['susceptibles'] != new['susceptibles'])
+    changed = records(new[moved])
+    for post, previous in zip(changed, records(old[moved])):
+        post['vacants'] = {'before': previous['vacants'], 'after': post['vacants']}
+        post['susceptibles'] = {'before': previous['susceptibles'], 'after': post['susceptibles']}
+
+    appeared = records(after.loc[after.index.difference(before.index)])
+    disappeared = records(before.loc[before.index.difference(after.index)])
+    return {
+        'summary': {
+            'appeared': len(appeared),
+            'disappeared': len(disappeared),
+            'changed': len(changed),
+            'unchanged': len(common) - len(changed),
+        },
+        'appeared': appeared,
+        'disappeared': disappeared,
+        'changed': changed,
+    }
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def build_catalog(catalog_path=CATALOG_FILE, snapshot_dir=SNAPSHOT_DIR, annuaire_path=None):
+    """Build the snapshot of every dataset and the diff of every pair; returns the versions by id"""
+    import pandas as pd
+
+    from mouvement.data import read_addresses, read_positions
+    from mouvement.pipeline import load_annuaire_data
+
+    catalog = read_catalog(catalog_path)
+    snapshot_dir = Path(snapshot_dir)
+    positions = {dataset_id: read_positions(entry['positions'])
+                 for dataset_id, entry in catalog['datasets'].items()}
+
+    # One annuaire lookup for the schools of all the datasets
+    schools_dict = load_annuaire_data(pd.concat(positions.values(), ignore_index=True), annuaire_path)
+
+    versions = {}
+    for dataset_id, entry in catalog['datasets'].items():
+        rep_path = entry.get('rep', 'REP_Toulouse.csv')
+        data = build_snapshot_data(positions=positions[dataset_id], addresses=read_addresses(entry['addresses']),
+                                   schools_dict=schools_dict, rep_path=rep_path,
+                                   source_files=[entry['positions'], entry['addresses'], rep_path])
+        write_snapshot(data, snapshot_dir / dataset_id)
+        versions[dataset_id] = data['version']
+
+    posts = {dataset_id: post_table(table) for dataset_id, table in positions.items()}
+    positions_hashes = {dataset_id: file_sha256(entry['positions'])
+                        for dataset_id, entry in catalog['datasets'].items()}
+    for from_id in versions:
+        for to_id in versions:
+            if from_id == to_id:
+                continue
+            path = diff_path(snapshot_dir, from_id, to_id)
+            header = {'from': from_id, 'to': to_id,
+                      'from_version': versions[from_id], 'to_version': versions[to_id],
+                      'from_positions': positions_hashes[from_id], 'to_positions': positions_hashes[to_id]}
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+                if all(previous.get(key) == value for key, value in header.items()):
+                    continue
+            diff = {**header, **diff_posts(posts[from_id], posts[to_id])}
+            _write_json(path, diff)
+            logger.info(f"Diff {from_id} -> {to_id} written to {path}: {diff['summary']}")
+    return versions
+
+
+class Catalog:
+    """
+    The datasets of the catalog file, each with its own SnapshotStore, loaded on
+    first access. Loaded datasets and diffs are kept in an LRU until their
+    estimated memory exceeds max_bytes. Without a catalog file, the snapshot of
+    snapshot_dir is served as the only dataset.
+    """
+
+    def __init__(self, path=CATALOG_FILE, snapshot_dir=SNAPSHOT_DIR, max_bytes=MAX_BYTES):
+        self.path = Path(path)
+        self.snapshot_dir = Path(snapshot_dir)
+        self.max_bytes = max_bytes
+        self.store = SnapshotStore(snapshot_dir)
+        self._lock = threading.Lock()
+        self._catalog = {'default': None, 'datasets': {}}
+        self._stamp = None
+        # key -> [value, estimated bytes], least recently used first
+        self._lru = OrderedDict()
+
+    def catalog(self):
+        """The catalog file content, re-read when the file changes"""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return {'default': None, 'datasets': {}}
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            try:
+                self._catalog = read_catalog(self.path)
+            except Exception as e:
+                logger.error(f"Error reading the dataset catalog: {str(e)}")
+            self._stamp = stamp
+        return self._catalog
+
+    def datasets(self):
+        """The public description of the datasets, in catalog order"""
+        catalog = self.catalog()
+        return {
+            'default': catalog['default'],
+            'datasets': [{'id': dataset_id, **{key: entry.get(key) for key in ('label', 'year', 'group')}}
+                         for dataset_id, entry in catalog['datasets'].items()],
+        }
+
+    def resolve(self, dataset_id=None):
+        """The id of a dataset, the default one if None; KeyError if unknown"""
+        catalog = self.catalog()
+        if dataset_id is None:
+            return catalog['default']
+        if dataset_id not in catalog['datasets']:
+            raise KeyError(dataset_id)
+        return dataset_id
+
+    def _lookup(self, key, create):
+        """The cached value of key, or create() added to the LRU without a weight yet"""
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                cache_hit('catalog')
+                return entry[0]
+            cache_miss('catalog')
+            value = create()
+            self._lru[key] = [value, 0]
+            return value
+
+    def _weigh(self, key, value, size):
+        """Record the weight of a value and evict the least recently used ones over the limit"""
+        with self._lock:
+            # Last, so that what is being served is never evicted
+            self._lru[key] = [value, size]
+            self._lru.move_to_end(key)
+            total = sum(weight for _, weight in self._lru.values())
+            while total > self.max_bytes and len(self._lru) > 1:
+                evicted, (_, weight) = self._lru.popitem(last=False)
+                total -= weight
+                logger.info(f"Evicted {'/'.join(evicted)} from the catalog, {total / 1e6:.0f} MB loaded")
+
+    def get(self, dataset_id=None):
+        """The prepared snapshot of a dataset, the default one if None"""
+        dataset_id = self.resolve(dataset_id)
+        if dataset_id is None:
+            return self.store.get()
+        key = ('dataset', dataset_id)
+        store = self._lookup(key, lambda: SnapshotStore(self.snapshot_dir / dataset_id, build_missing=False))
+        snapshot = store.get()
+        self._weigh(key, store, store.size * MEMORY_FACTOR)
+        return snapshot
+
+    def diff(self, from_id, to_id):
+        """The precompressed diff payload between two datasets"""
+        from_id, to_id = self.resolve(from_id), self.resolve(to_id)
+        path = diff_path(self.snapshot_dir, from_id, to_id)
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        key = ('diff', from_id, to_id)
+        entry = self._lookup(key, dict)
+        if entry.get('stamp') != stamp:
+            body = path.read_bytes()
+            entry = {
+                'stamp': stamp,
+                'payload': make_payload(body, 'application/json', diff_etag(json.loads(body))),
+            }
+        size = sum(len(body) for body in entry['payload']['encodings'].values())
+        self._weigh(key, entry, size)
+        return entry['payload']
+
+    def snapshots(self):
+        """The snapshots in memory"""
+        with self._lock:
+            stores = [value for key, (value, _) in self._lru.items() if key[0] == 'dataset']
+        return [store.snapshot for store in [self.store, *stores] if store.snapshot is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the snapshots and diffs of the dataset catalog")
+    parser.add_argument('--catalog', default=str(CATALOG_FILE), help="Catalog file (default: %(default)s)")
+    parser.add_argument('--annuaire', metavar='FILE',
+                        help="Local annuaire export (JSON or GeoJSON) instead of the education.gouv.fr API")
+    parser.add_argument('--output-dir', default=str(SNAPSHOT_DIR),
+                        help="Directory where snapshots are written (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    versions = build_catalog(args.catalog, args.output_dir, args.annuaire)
+    for dataset_id, version in versions.items():
+        print(f"{dataset_id:<20} {version}")
+
+
+if __name__ == '__main__':
+    main()
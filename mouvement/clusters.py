@@ -0,0 +1,136 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from mouvement.spatial import GridIndex
+
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+RADIUS = 60  # cluster radius in pixels
+EXTENT = 256  # tile size in pixels
+
+# Cluster fields, in the order they are stored in the snapshot
+LON, LAT, COUNT, VACANTS, SUSCEPTIBLES, FEATURE_ID = range(6)
+
+
+def _project(lon, lat):
+    """Web Mercator position in [0, 1] x [0, 1]"""
+    sin = math.sin(math.radians(lat))
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return lon / 360 + 0.5, min(1.0, max(0.0, y))
+
+
+def _unproject(x, y):
+    lat = math.degrees(2 * math.atan(math.exp((1 - 2 * y) * math.pi)) - math.pi / 2)
+    return (x - 0.5) * 360, lat
+
+
+def build_clusters(features, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, radius=RADIUS, extent=EXTENT):
+    """
+    Precompute hierarchical clusters of the location groups, one level per zoom.
+
+    Starting from the individual features, each level greedily merges the points
+    of the level below that fall within `radius` pixels of each other at that
+    zoom, so clusters at zoom z are made of clusters at zoom z + 1. Each cluster
+    keeps its point count and the summed vacancies of its schools. Returns a
+    JSON-serializable dict stored in the snapshot.
+    """
+    # [x, y, count, vacants, susceptibles, feature_id]; feature_id is -1 for merged clusters
+    current = []
+    for feature in features:
+        lon, lat = feature['geometry']['coordinates']
+        props = feature['properties']
+        current.append([*_project(lon, lat), 1, props.get('vacants', 0),
+                        props.get('susceptibles', 0), feature['id']])
+
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        r = radius / (extent * 2 ** zoom)
+        grid = defaultdict(list)
+        for i, (x, y, *_) in enumerate(current):
+            grid[(int(x // r), int(y // r))].append(i)
+
+        merged = [False] * len(current)
+        next_level = []
+        for i, point in enumerate(current):
+            if merged[i]:
+                continue
+            merged[i] = True
+            members = [point]
+            cx, cy = int(point[0] // r), int(point[1] // r)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in grid.get((cx + dx, cy + dy), ()):
+                        other = current[j]
+                        if not merged[j] and (other[0] - point[0]) ** 2 + (other[1] - point[1]) ** 2 <= r * r:
+                            merged[j] = True
+                            members.append(other)
+
+            if len(members) == 1:
+                next_level.append(point)
+                continue
+            count = sum(m[2] for m in members)
+            next_level.append([
+                sum(m[0] * m[2] for m in members) / count,
+                sum(m[1] * m[2] for m in members) / count,
+                count,
+                sum(m[3] for m in members),
+                sum(m[4] for m in members),
+                -1,
+            ])
+
+        levels[str(zoom)] = [[*(round(v, 6) for v in _unproject(x, y)), count, vacants, susceptibles, feature_id]
+                             for x, y, count, vacants, susceptibles, feature_id in next_level]
+        current = next_level
+
+    return {'min_zoom': min_zoom, 'max_zoom': max_zoom, 'levels': levels}
+
+
+def cluster_arrays(clusters):
+    """The levels of build_clusters() as one (clusters x fields) array per zoom, by zoom"""
+    return {zoom: np.asarray(level, dtype=np.float64).reshape(-1, 6) for zoom, level in clusters['levels'].items()}
+
+
+class ClusterIndex:
+    """
+    Per-zoom spatial index over the precomputed clusters. Clusters are kept as
+    arrays (see cluster_arrays) and turned into GeoJSON when a query returns
+    them; single locations come from `feature_json(id)`.
+    """
+
+    def __init__(self, min_zoom, max_zoom, levels, feature_json, spatial):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.feature_json = feature_json
+        # Beyond max_zoom every location is drawn on its own
+        self.spatial = spatial
+        self.levels = {}
+        for zoom, level in levels.items():
+            index = GridIndex(level[:, [LAT, LON]], cell_size=max(0.05, 360 / 2 ** int(zoom) / 8))
+            self.levels[int(zoom)] = (index, level)
+
+    def _cluster_json(self, cluster):
+        lon, lat, count, vacants, susceptibles, feature_id = cluster.tolist()
+        if feature_id >= 0:
+            return self.feature_json(int(feature_id))
+        return ('{"type": "Feature", "geometry": {"type": "Point", "coordinates": [%r, %r]}, '
+                '"properties": {"cluster": true, "point_count": %d, "vacants": %d, "susceptibles": %d}}') % (
+            lon, lat, count, vacants, susceptibles)
+
+    def query(self, zoom, min_lon, min_lat, max_lon, max_lat):
+        """GeoJSON features (as JSON strings) of the clusters visible at this zoom"""
+        zoom = max(self.min_zoom, zoom)
+        if zoom > self.max_zoom:
+            return [self.feature_json(i) for i in self.spatial.query_bbox(min_lon, min_lat, max_lon, max_lat)]
+        index, clusters = self.levels[zoom]
+        return [self._cluster_json(clusters[i]) for i in index.query_bbox(min_lon, min_lat, max_lon, max_lat)]
+
+    def level(self, zoom):
+        """Longitudes, latitudes and GeoJSON (as JSON strings) of every feature drawn at this zoom"""
+        zoom = max(self.min_zoom, zoom)
+        if zoom > self.max_zoom:
+            points = self.spatial.points
+            return points[:, 1], points[:, 0], [self.feature_json(i) for i in range(len(points))]
+        _, clusters = self.levels[zoom]
+        return clusters[:, LON], clusters[:, LAT], [self._cluster_json(cluster) for cluster in clusters]
@@ -0,0 +1,422 @@
+import json
+import re
+import logging
+import urllib.parse
+import io
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+from mouvement.annuaire import load_annuaire
+from mouvement.metrics import cache_hit, cache_miss, stage_timer
+
+logger = logging.getLogger(__name__)
+
+def get_directions_url(destination_address):
+    """
+    Generate a Google Maps directions URL for cycling from a fixed starting point
+    to the destination address.
+    """
+    base_url = "https://www.google.com/maps/dir/"
+    start_address = "15 rue de la chaussée, 31000 toulouse"
+    
+    # URL encode the addresses
+    start_encoded = urllib.parse.quote(start_address)
+    dest_encoded = urllib.parse.quote(destination_address)
+    
+    # Add cycling mode parameter
+    return f"{base_url}{start_encoded}/{dest_encoded}/?mode=bicycling"
+
+ANNUAIRE_URL = "https://data.education.gouv.fr/api/explore/v2.1/catalog/datasets/fr-en-annuaire-education/exports/json?lang=fr&timezone=Europe%2FBerlin"
+
+CACHE_FILE = Path('schools_data_cache.pickle')
+LEGACY_CACHE_FILE = Path('schools_data_cache.json')
+CACHE_DURATION = 24 * 60 * 60  # 24 hours in seconds
+FULL_REFRESH_INTERVAL = 7 * 24 * 60 * 60  # between full downloads, deltas otherwise
+
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_refresh_listeners = []
+
+def add_refresh_listener(callback):
+    """Register a callback run after a background refresh has updated the cache"""
+    if callback not in _refresh_listeners:
+        _refresh_listeners.append(callback)
+
+def _read_cache():
+    """
+    Return the cache entry: the schools plus the filter they were built with,
+    the HTTP validators, the delta watermark and fetch times. None if there is no cache.
+    """
+    if CACHE_FILE.exists():
+        with open(CACHE_FILE, 'rb') as f:
+            return pickle.load(f)
+    if LEGACY_CACHE_FILE.exists():
+        with open(LEGACY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        # Older caches are a bare dict of every school in France
+        if 'schools' not in cached:
+            cached = {'filter': None, 'schools': cached}
+        cached.update(fetched_at=LEGACY_CACHE_FILE.stat().st_mtime, full_fetched_at=0)
+        return cached
+    return None
+
+def _write_cache(entry):
+    """Write the cache entry atomically in pickle format, much faster to load than JSON"""
+    tmp = CACHE_FILE.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, CACHE_FILE)
+
+def _cache_covers(cache_filter, uais, departement):
+    """Whether a cache built with cache_filter holds every school we ask for"""
+    if cache_filter is None:
+        return True
+    if cache_filter['departement'] and cache_filter['departement'] != departement:
+        return False
+    if cache_filter['uais'] is None:
+        return True
+    return uais is not None and set(uais) <= set(cache_filter['uais'])
+
+def _fetch_schools_data(entry, uais, departement):
+    """
+    Fetch schools data from the API and return a new cache entry.
+
+    With a recent full download and a 'date_maj_ligne' watermark, only the rows
+    updated since are fetched and merged into the entry. Otherwise the full
+    export is requested with If-None-Match / If-Modified-Since, and a 304 keeps
+    the cached schools.
+    """
+    import requests
+
+    now = time.time()
+    url = ANNUAIRE_URL
+    headers = {}
+    delta = (entry is not None and entry.get('watermark')
+             and now - entry.get('full_fetched_at', 0) < FULL_REFRESH_INTERVAL)
+    if delta:
+        url += '&where=' + urllib.parse.quote(f"date_maj_ligne>=date'{entry['watermark']}'")
+    elif entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    
+    info = {}
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            logger.info("Schools data not modified")
+            return {**entry, 'fetched_at': now, 'full_fetched_at': now}
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # Let TextIOWrapper see EOF instead of a closed stream
+        response.raw.auto_close = False
+        stream = io.TextIOWrapper(response.raw, encoding='utf-8')
+        schools_dict = load_annuaire(stream, uais=uais, departement=departement, info=info)
+    
+    if delta:
+        logger.info(f"Merged {len(schools_dict)} updated schools")
+        merged = dict(entry['schools'])
+        merged.update(schools_dict)
+        watermark = max(entry['watermark'], info['latest_update'] or entry['watermark'])
+        return {**entry, 'schools': merged, 'watermark': watermark, 'fetched_at': now}
+    
+    logger.info(f"Downloaded and processed {len(schools_dict)} schools")
+    return {
+        'filter': {'uais': uais, 'departement': departement} if uais is not None or departement else None,
+        'schools': schools_dict,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'watermark': info['latest_update'],
+        'fetched_at': now,
+        'full_fetched_at': now,
+    }
+
+def _refresh_in_background(entry):
+    """Refresh the cache in a background thread, at most one at a time"""
+    global _refresh_thread
+    
+    def refresh():
+        try:
+            cache_filter = entry['filter'] or {'uais': None, 'departement': None}
+            _write_cache(_fetch_schools_data(entry, cache_filter['uais'], cache_filter['departement']))
+        except Exception as e:
+            logger.error(f"Error refreshing schools data: {str(e)}")
+            return
+        for callback in list(_refresh_listeners):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in schools data refresh listener: {str(e)}")
+    
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        logger.info("Schools data cache is stale, refreshing in the background")
+        _refresh_thread = threading.Thread(target=refresh, name='schools-data-refresh')
+        _refresh_thread.start()
+
+def download_schools_data(uais=None, departement=None):
+    """
+    Download schools data from the education.gouv.fr API and convert it to our format.
+    The export is streamed and only the schools in `uais` (and in `departement`,
+    if given) are kept, so memory scales with what we serve rather than with the
+    whole of France.
+    
+    A stale cache is returned as is while it is revalidated in the background;
+    only a missing cache, or one that lacks the requested schools, is fetched
+    synchronously.
+    """
+    if uais is not None:
+        uais = sorted({uai.upper() for uai in uais})
+    
+    entry = _read_cache()
+    if entry is not None and _cache_covers(entry['filter'], uais, departement):
+        cache_hit('annuaire')
+        if time.time() - entry['fetched_at'] >= CACHE_DURATION:
+            _refresh_in_background(entry)
+        else:
+            logger.info("Using cached schools data")
+        return entry['schools']
+    
+    cache_miss('annuaire')
+    logger.info("Downloading fresh schools data from API")
+    try:
+        new_entry = _fetch_schools_data(None, uais, departement)
+        _write_cache(new_entry)
+        return new_entry['schools']
+    except Exception as e:
+        logger.error(f"Error downloading schools data: {str(e)}")
+        # If we have a cache, use it even if it doesn't cover everything
+        if entry is not None:
+            logger.info("Using old cache due to download error")
+            return entry['schools']
+        return {}
+
+def build_positions_index(df_list):
+    """
+    Build a UAI -> positions index from the mouvement rows in a single pass.
+    The UAI is kept as written in 'Etablissement', so a lookup returns the same
+    rows as a case-sensitive search for that code in the column.
+    """
+    import pandas as pd
+
+    vacants = df_list['Nb de postes vacants']
+    total = vacants + df_list["Nb de postes susceptibles d'être vacants"]
+    ratio = (vacants.astype(str) + '/' + total.astype(str)).where(total > 0, 'N/A')
+    
+    positions = pd.DataFrame({
+        'uai': df_list['Etablissement'].str.extract(r'([0-9]{7}[A-Za-z])', expand=False),
+        'type': df_list['Type de poste'],
+        'specialization': df_list['Nature de support'],
+        'ratio': ratio,
+    }).dropna(subset=['uai'])
+
+    # One to_dict for the whole table, much cheaper than one per group
+    index = {}
+    records = positions[['type', 'specialization', 'ratio']].to_dict('records')
+    for uai, record in zip(positions['uai'], records):
+        index.setdefault(uai, []).append(record)
+    return index
+
+def _count(value):
+    """Vacancy count from a CSV cell, 0 when missing"""
+    import pandas as pd
+
+    return int(value) if pd.notna(value) else 0
+
+def referenced_uais(addresses):
+    """UAI codes of the schools in schools_with_addresses, as matched by load_schools()"""
+    return set(addresses['school_name'].str.extract(r'\(([0-9A-Za-z]+)\)', expand=False).dropna().str.upper())
+
+def read_positions(path='mouvement_complet_clean.csv'):
+    """The positions extracted from the PDF; the file has no header"""
+    import pandas as pd
+
+    return pd.read_csv(path, sep=';', encoding='utf-8', header=None)
+
+def read_addresses(path='schools_with_addresses.csv'):
+    """The positions with the addresses and coordinates added by school_addresses.py"""
+    import pandas as pd
+
+    return pd.read_csv(path, sep=';', encoding='utf-8')
+
+def load_schools(positions=None, addresses=None, schools_dict=None):
+    """
+    Build the GeoJSON of the schools. The inputs default to the CSV files and the
+    annuaire cache; the pipeline passes them in memory instead: `positions` as
+    read from mouvement_complet_clean.csv (no header), `addresses` as
+    schools_with_addresses.csv and `schools_dict` from download_schools_data().
+    """
+    try:
+        # Read the CSV file with the correct headers
+        headers = [
+            "Numéro du poste", "Commune", "Etablissement", "Type de poste",
+            "Nature de support", "Spécialité / Nb classes",
+            "Nb de postes vacants", "Nb de postes susceptibles d'être vacants"
+        ]
+        
+        with stage_timer('csv_read'):
+            if positions is None:
+                # First read the original CSV to get the list data
+                positions = read_positions()
+            df = addresses
+            if df is None:
+                # Then read the CSV with addresses and coordinates
+                df = read_addresses()
+        
+        if schools_dict is None:
+            with stage_timer('annuaire_load'):
+                # Download data from the API for the schools referenced in the CSV only
+                schools_dict = download_schools_data(uais=referenced_uais(df))
+        
+        with stage_timer('join'):
+            df_list = positions.copy()
+            df_list.columns = headers
+        
+            # Group the positions by UAI once instead of scanning df_list per school
+            positions_index = build_positions_index(df_list)
+        
+            # Convert DataFrame to list of dictionaries
+            schools = df.to_dict('records')
+        
+            # Convert to GeoJSON format for the map
+            geojson = {
+                "type": "FeatureCollection",
+                "features": []
+            }
+        
+            # Statistics tracking
+            stats = {
+                'total': len(schools),
+                'found': 0,
+                'not_found': 0,
+                'error': 0
+            }
+        
+            # Create a dictionary to group schools by coordinates
+            location_groups = {}
+        
+            for school in schools:
+                try:
+                    # Extract UAI code from school name
+                    uai_match = re.search(r'\(([0-9A-Za-z]+)\)', school['school_name'])
+                    if uai_match:
+                        uai = uai_match.group(1).upper()
+                    
+                        # Get school data from API data
+                        school_data = schools_dict.get(uai)
+                        if school_data and school_data['latitude'] is not None and school_data['longitude'] is not None:
+                            # Create a unique key for this school's location
+                            coord_key = (float(school_data['latitude']), float(school_data['longitude']))
+                        
+                            # Initialize the location group if it doesn't exist
+                            if coord_key not in location_groups:
+                                location_groups[coord_key] = {
+                                    'coordinates': [float(school_data['longitude']), float(school_data['latitude'])],
+                                    'schools': [],
+                                    'vacants': 0,
+                                    'susceptibles': 0
+                                }
+                        
+                            # Look up all positions for this school in the UAI index
+                            positions = list(positions_index.get(uai, ()))
+                        
+                            # Add school to the location group with all its positions
+                            location_groups[coord_key]['schools'].append({
+                                "uai": uai,
+                                "name": school['school_name'],
+                                "city": school_data['commune'],
+                                "address": school_data['address'],
+                                "positions": positions,
+                                "directions_url": get_directions_url(school_data['address'])
+                            })
+                            location_groups[coord_key]['vacants'] += _count(school.get('num_vacant'))
+                            location_groups[coord_key]['susceptibles'] += _count(school.get('num_potential'))
+                            stats['found'] += 1
+                        else:
+                            stats['not_found'] += 1
+                    else:
+                        stats['not_found'] += 1
+                except Exception as e:
+                    logger.error(f"Error processing school {school['school_name']}: {str(e)}")
+                    stats['error'] += 1
+        
+            # Create GeoJSON features from location groups
+            for coord_key, group in location_groups.items():
+                feature = {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": group['coordinates']
+                    },
+                    "properties": {
+                        "schools": group['schools'],
+                        "vacants": group['vacants'],
+                        "susceptibles": group['susceptibles']
+                    }
+                }
+                geojson["features"].append(feature)
+        
+        # Print statistics
+        logger.info("\nSchool Processing Statistics:")
+        logger.info(f"Total schools: {stats['total']}")
+        logger.info(f"Schools with coordinates: {stats['found']}")
+        logger.info(f"Schools without coordinates: {stats['not_found']}")
+        logger.info(f"Errors: {stats['error']}")
+        
+        return geojson, stats, None
+        
+    except Exception as e:
+        logger.error(f"Error loading schools data: {str(e)}")
+        return {"type": "FeatureCollection", "features": []}, {"total": 0, "found": 0, "not_found": 0, "error": 1}, None
+
+def _read_rep_rows(path):
+    """Rows of REP_Toulouse.csv as dicts, trying the encodings it has been saved in"""
+    import csv
+
+    encodings = ['utf-8', 'latin1']
+    for encoding in encodings:
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return list(csv.DictReader(f))
+        except UnicodeDecodeError:
+            continue
+    return []
+
+def load_rep_schools(path='REP_Toulouse.csv'):
+    """Load the list of REP schools from REP_Toulouse.csv"""
+    try:
+        rep_schools = []
+        for row in _read_rep_rows(path):
+            rne = row.get('RNE', '').strip().upper()
+            if rne:  # Only add non-empty RNE codes
+                rep_schools.append(rne)
+        
+        logger.info(f"Loaded {len(rep_schools)} REP RNE codes from {path}")
+        
+        return rep_schools
+    except Exception as e:
+        logger.error(f"Error loading REP schools: {str(e)}")
+        return []
+
+def load_rep_status(path='REP_Toulouse.csv'):
+    """RNE -> 'REP' or 'REP+' for the schools of REP_Toulouse.csv"""
+    try:
+        rep_status = {}
+        for row in _read_rep_rows(path):
+            rne = row.get('RNE', '').strip().upper()
+            if not rne:
+                continue
+            # Some rows have the 2015 status one column further
+            candidates = [row.get('REP/REP+ (2015)') or '', *(row.get(None) or [])]
+            status = next((c.strip() for c in candidates if c.strip() in ('REP', 'REP+')), None)
+            if status is None:
+                status = 'REP+' if (row.get('REP+ (2014)') or '').strip() else 'REP'
+            rep_status[rne] = status
+        return rep_status
+    except Exception as e:
+        logger.error(f"Error loading REP statuses: {str(e)}")
+        return {}
@@ -0,0 +1,159 @@
+"""
+Static export: the map and its data as plain files, for nginx or any static host.
+
+    python -m mouvement.export [--output-dir site] [--dataset ID] [--renderer markers]
+
+The snapshot served by the app (built with load_schools() and load_rep_schools()
+when there is none) is written as:
+
+- index.html: the page, reading the files below instead of the API
+- schools.geojson and rep.json: as /api/schools.geojson and /api/rep.json
+- tiles/<z>/<x>/<y>.geojson: the features of /api/clusters at zoom z, split in
+  tiles of TILE_SPAN x TILE_SPAN map tiles, with tiles/index.json listing the
+  non-empty ones
+- schools/<uai>.json: as /api/schools/<uai>
+
+Every file has precompressed .gz (and .br, with brotli) copies next to it, for
+nginx's gzip_static. The new export replaces the output directory in one rename
+once complete.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mouvement.catalog import CATALOG_FILE, Catalog
+from mouvement.payload import body_bytes, feature_collection, make_payload
+from mouvement.snapshot import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = Path('site')
+
+# Map tiles a side of an export tile: a viewport needs a handful of files
+TILE_SPAN = 4
+
+# Latitude range of Web Mercator
+MAX_LATITUDE = 85.05112878
+
+# File suffix of each precompressed encoding
+SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+
+def tile_coords(lon, lat, zoom):
+    """Export tile (x, y) of each point at a zoom, as in the page's JavaScript"""
+    n = 2 ** zoom / TILE_SPAN
+    last = max(math.ceil(n) - 1, 0)
+    sin = np.sin(np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)))
+    x = (np.asarray(lon) / 360 + 0.5) * n
+    y = (0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi) * n
+    return np.clip(np.floor(x), 0, last).astype(int), np.clip(np.floor(y), 0, last).astype(int)
+
+
+def write_payload(path, payload):
+    """Write every encoding of a payload: path itself, path.gz and path.br"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for encoding, body in payload['encodings'].items():
+        path.with_name(path.name + SUFFIXES[encoding]).write_bytes(body_bytes(body))
+
+
+def write_tiles(output_dir, clusters):
+    """Write the features of every zoom level in tiles; returns the tiles written, by zoom"""
+    index = {}
+    # Above max_zoom the locations are drawn on their own, as at max_zoom + 1
+    for zoom in range(clusters.min_zoom, clusters.max_zoom + 2):
+        lon, lat, features = clusters.level(zoom)
+        x, y = tile_coords(lon, lat, zoom)
+        tiles = {}
+        for tile_x, tile_y, feature in zip(x.tolist(), y.tolist(), features):
+            tiles.setdefault(f"{tile_x}/{tile_y}", []).append(feature)
+        for key, tile_features in tiles.items():
+            body = feature_collection(tile_features)
+            write_payload(output_dir / 'tiles' / str(zoom) / f"{key}.geojson",
+                          make_payload(body, 'application/geo+json', None))
+        index[str(zoom)] = sorted(tiles)
+    return index
+
+
+def export_site(output_dir=OUTPUT_DIR, dataset=None, renderer='markers',
+                catalog_path=CATALOG_FILE, snapshot_dir=SNAPSHOT_DIR):
+    """Export a dataset of the catalog (the default one if None) to output_dir; returns its snapshot"""
+    from flask import render_template
+
+    from mouvement.app import app
+
+    snapshot = Catalog(catalog_path, snapshot_dir).get(dataset)
+    output_dir = Path(output_dir)
+    staging = output_dir.with_name(output_dir.name + '.new')
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+
+    started = time.perf_counter()
+    for name, filename in (('schools', 'schools.geojson'), ('rep', 'rep.json')):
+        write_payload(staging / filename, snapshot['payloads'][name])
+
+    clusters = snapshot['clusters']
+    tiles = write_tiles(staging, clusters)
+    (staging / 'tiles').mkdir(exist_ok=True)
+    (staging / 'tiles' / 'index.json').write_text(json.dumps(tiles, separators=(',', ':')), encoding='utf-8')
+
+    model = snapshot['model']
+    uais = np.unique(model.uai).tolist()
+    for uai in uais:
+        write_payload(staging / 'schools' / f"{uai}.json",
+                      make_payload(snapshot['detail_json'](uai), 'application/json', None))
+
+    static_site = {'tile_span': TILE_SPAN, 'min_zoom': clusters.min_zoom, 'max_zoom': clusters.max_zoom + 1}
+    with app.test_request_context('/'):
+        page = render_template('index.html',
+                               stats=snapshot['stats'],
+                               bounds=snapshot['bounds'],
+                               renderer=renderer,
+                               dataset=None,
+                               datasets=[],
+                               static_site=static_site,
+                               table_html=None)
+    write_payload(staging / 'index.html', make_payload(page, 'text/html', None))
+
+    # Swap the complete export in place of the previous one
+    if output_dir.exists():
+        previous = output_dir.with_name(output_dir.name + '.old')
+        if previous.exists():
+            shutil.rmtree(previous)
+        os.replace(output_dir, previous)
+        os.replace(staging, output_dir)
+        shutil.rmtree(previous)
+    else:
+        os.replace(staging, output_dir)
+
+    logger.info(f"Exported snapshot {snapshot['version']} to {output_dir}: "
+                f"{sum(len(keys) for keys in tiles.values())} tiles, {len(uais)} schools "
+                f"in {time.perf_counter() - started:.1f}s")
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the map and its data as static files")
+    parser.add_argument('--output-dir', default=str(OUTPUT_DIR), help="Directory written (default: %(default)s)")
+    parser.add_argument('--dataset', help="Dataset of the catalog to export (default: the default one)")
+    parser.add_argument('--renderer', choices=('markers', 'canvas'), default='markers',
+                        help="Map rendering mode of the page (default: %(default)s)")
+    parser.add_argument('--catalog', default=str(CATALOG_FILE), help="Catalog file (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', default=str(SNAPSHOT_DIR),
+                        help="Directory of the snapshots (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = export_site(args.output_dir, args.dataset, args.renderer, args.catalog, args.snapshot_dir)
+    print(f"Snapshot {snapshot['version']} exported to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Faceted search over the posts shown on the map.
+
+The snapshot build stores an inverted index per facet (value -> post numbers),
+packed as one row of bits per value. A query reads the bitsets of the values
+it filters on as Python ints, so filtering is a few ORs and ANDs. Facet counts
+are a bincount of the value codes of the matching posts.
+"""
+import numpy as np
+
+# Facets, as query parameters of /api/search
+FACETS = ('commune', 'nature', 'specialite', 'rep', 'vacant')
+
+# REP facet value of the schools outside the REP list
+NOT_REP = 'hors REP'
+
+UAI_PATTERN = r'\(([0-9A-Za-z]+)\)'
+
+
+def post_values(addresses, features, rep_status):
+    """
+    The posts of schools_with_addresses that are on the map, as a DataFrame
+    with their feature id and one column per facet
+    """
+    import pandas as pd
+
+    feature_of = {school['uai']: feature['id']
+                  for feature in features for school in feature['properties']['schools']}
+    uais = addresses['school_name'].str.extract(UAI_PATTERN, expand=False).str.upper()
+    feature_ids = uais.map(feature_of)
+    on_map = feature_ids.notna().values
+    posts = addresses[on_map]
+    vacants = pd.to_numeric(posts['num_vacant'], errors='coerce').fillna(0)
+    return pd.DataFrame({
+        'feature': feature_ids[on_map].astype(int).values,
+        'commune': posts['city'].fillna('').astype(str).str.strip().values,
+        'nature': posts['nature'].fillna('').astype(str).str.strip().values,
+        'specialite': posts['specialization'].fillna('').astype(str).str.strip().values,
+        'rep': uais[on_map].map(rep_status).fillna(NOT_REP).values,
+        'vacant': np.where(vacants.values > 0, '1', '0'),
+    })
+
+
+def build_facets(addresses, features, rep_status):
+    """
+    Inverted indexes of the posts on the map, stored in the snapshot: the
+    feature id of each post and, per facet, value -> post numbers
+    """
+    posts = post_values(addresses, features, rep_status)
+    index = {}
+    for facet in FACETS:
+        groups = posts.groupby(facet, sort=True).indices
+        index[facet] = {str(value): numbers.tolist() for value, numbers in groups.items()}
+    return {'post_feature': posts['feature'].tolist(), 'index': index}
+
+
+def facet_arrays(facets):
+    """
+    The indexes of build_facets() as the values of each facet and arrays, by
+    name: the feature of each post and, per facet, the value code of each post
+    and one row of packed bits per value
+    """
+    post_feature = np.asarray(facets['post_feature'], dtype=np.int64)
+    size = len(post_feature)
+    values = {}
+    arrays = {'post_feature': post_feature}
+    for facet, index in facets['index'].items():
+        values[facet] = list(index)
+        codes = np.zeros(size, dtype=np.int32)
+        bits = np.zeros((len(index), (size + 7) // 8), dtype=np.uint8)
+        for code, numbers in enumerate(index.values()):
+            codes[numbers] = code
+            member = np.zeros(size, dtype=bool)
+            member[numbers] = True
+            bits[code] = np.packbits(member, bitorder='little')
+        arrays[f'{facet}.codes'] = codes
+        arrays[f'{facet}.bits'] = bits
+    return values, arrays
+
+
+def _numbers(bitset, size):
+    data = np.frombuffer(bitset.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder='little')[:size])
+
+
+class FacetIndex:
+    """
+    Bitsets of the posts per facet value, to filter, and the value of each
+    post per facet, to count the values of the matching posts. The arrays of
+    facet_arrays() may be views of a memory-mapped file; the bitsets of the
+    values a query filters on are read from them as Python ints.
+    """
+
+    def __init__(self, values, arrays):
+        self.post_feature = arrays['post_feature']
+        self.size = len(self.post_feature)
+        self.feature_count = int(self.post_feature.max()) + 1 if self.size else 0
+        self.all = (1 << self.size) - 1
+        self.values = values
+        self.code_of = {facet: {value: code for code, value in enumerate(facet_values)}
+                        for facet, facet_values in values.items()}
+        self.codes = {facet: arrays[f'{facet}.codes'] for facet in values}
+        self.bits = {facet: arrays[f'{facet}.bits'] for facet in values}
+
+    def _bitset(self, facet, value):
+        code = self.code_of[facet].get(value)
+        if code is None:
+            return 0
+        return int.from_bytes(self.bits[facet][code].tobytes(), 'little')
+
+    def _count(self, facet, numbers):
+        counts = np.bincount(self.codes[facet][numbers], minlength=len(self.values[facet]))
+        return dict(zip(self.values[facet], counts.tolist()))
+
+    def search(self, filters):
+        """
+        Posts matching `filters` (facet -> accepted values): values of a facet
+        are alternatives, facets must all match. Returns the ids of the features
+        holding these posts, the number of posts and, per facet, the number of
+        posts for each value given the filters on the other facets.
+        """
+        masks = {}
+        for facet, values in filters.items():
+            mask = 0
+            for value in values:
+                mask |= self._bitset(facet, value)
+            masks[facet] = mask
+
+        def combine(skip=None):
+            result = self.all
+            for facet, mask in masks.items():
+                if facet != skip:
+                    result &= mask
+            return result
+
+        matches = _numbers(combine(), self.size)
+        counts = {}
+        for facet in self.values:
+            numbers = _numbers(combine(skip=facet), self.size) if facet in masks else matches
+            counts[facet] = self._count(facet, numbers)
+
+        features = np.zeros(self.feature_count, dtype=bool)
+        features[self.post_feature[matches]] = True
+        return np.flatnonzero(features).tolist(), len(matches), counts
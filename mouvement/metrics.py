@@ -0,0 +1,167 @@
+"""
+In-process metrics, served in the Prometheus text format on /metrics.
+
+Stages of the data work are timed with `stage_timer`; the timings of the
+stages run while serving a request are also returned to it in a
+Server-Timing header (see app.py).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_local = threading.local()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A counter per combination of label values"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._sources = []
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def track(self, source):
+        """Add the counts returned by `source()` ({label values: count}) when collecting"""
+        self._sources.append(source)
+
+    def values(self):
+        with self._lock:
+            values = dict(self._values)
+        for source in self._sources:
+            for key, count in source().items():
+                values[key] = values.get(key, 0) + count
+        return values
+
+    def lines(self):
+        for key, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """A histogram with fixed buckets per combination of label values"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            # [count per bucket (the last one is +Inf), sum]
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def lines(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(total, 6))}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+REQUEST_SECONDS = Histogram('mouvement_request_duration_seconds', "Time to serve a request",
+                            ('endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram('mouvement_stage_duration_seconds',
+                          "Time spent in each data stage (csv_read, annuaire_load, join, clusters, facets, serialization, render)",
+                          ('stage',))
+CACHE_REQUESTS = Counter('mouvement_cache_requests_total', "Cache lookups by cache and result (hit or miss)",
+                         ('cache', 'result'))
+
+
+def cache_hit(cache):
+    CACHE_REQUESTS.inc(cache=cache, result='hit')
+
+
+def cache_miss(cache):
+    CACHE_REQUESTS.inc(cache=cache, result='miss')
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a block as one stage, in the histogram and in the current request's timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def start_request():
+    """Collect the stage timings of the current thread until end_request()"""
+    _local.timings = []
+
+
+def end_request():
+    """The (stage, seconds) timed since start_request()"""
+    timings = getattr(_local, 'timings', None) or []
+    _local.timings = None
+    return timings
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.lines())
+
+    # Hit rates, for dashboards that do not compute them from the counter
+    totals = {}
+    for (cache, result), count in CACHE_REQUESTS.values().items():
+        hits, total = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result == 'hit' else 0), total + count)
+    lines.append("# HELP mouvement_cache_hit_ratio Share of cache lookups that were hits")
+    lines.append("# TYPE mouvement_cache_hit_ratio gauge")
+    for cache, (hits, total) in sorted(totals.items()):
+        if total:
+            lines.append(f"mouvement_cache_hit_ratio{_format_labels(('cache',), (cache,))} {_format_value(round(hits / total, 6))}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,185 @@
+"""
+Columnar model of the served data: one array per field instead of a dict per
+location, school and position.
+
+Locations (the features of the map) hold schools and schools hold positions;
+both relations are offsets: the schools of location i are the rows
+school_start[i]:school_start[i + 1] of the school columns, and likewise for
+the positions of a school. Repeated strings (communes, position types,
+ratios...) are stored once per column and referenced by an integer code.
+JSON is only produced when a response needs it.
+"""
+import json
+
+import numpy as np
+
+from mouvement.data import get_directions_url
+
+# Position fields, in the order of the school details
+POSITION_FIELDS = ('type', 'specialization', 'ratio')
+
+
+def _encode(values):
+    """A string column as its distinct values and a code per row"""
+    table = {}
+    codes = [table.setdefault(value, len(table)) for value in values]
+    return {'values': list(table), 'codes': codes}
+
+
+def build_model(features):
+    """
+    Columns of the features of load_schools(), JSON-serializable, stored in the
+    snapshot. A school listed several times at a location (once per position
+    row) is kept once, with its first entry.
+    """
+    locations = {'lon': [], 'lat': [], 'vacants': [], 'susceptibles': [], 'school_start': [0]}
+    schools = {'uai': [], 'name': [], 'city': [], 'address': [], 'position_start': [0]}
+    positions = {field: [] for field in POSITION_FIELDS}
+
+    for feature in features:
+        lon, lat = feature['geometry']['coordinates']
+        props = feature['properties']
+        locations['lon'].append(lon)
+        locations['lat'].append(lat)
+        locations['vacants'].append(props['vacants'])
+        locations['susceptibles'].append(props['susceptibles'])
+        seen = set()
+        for school in props['schools']:
+            if school['uai'] in seen:
+                continue
+            seen.add(school['uai'])
+            for field in ('uai', 'name', 'city', 'address'):
+                schools[field].append(school[field])
+            for position in school['positions']:
+                for field in POSITION_FIELDS:
+                    positions[field].append(position[field])
+            schools['position_start'].append(len(positions['type']))
+        locations['school_start'].append(len(schools['uai']))
+
+    for field in ('name', 'city', 'address'):
+        schools[field] = _encode(schools[field])
+    for field in POSITION_FIELDS:
+        positions[field] = _encode(positions[field])
+    return {'locations': locations, 'schools': schools, 'positions': positions}
+
+
+def _string_arrays(column):
+    """A column of _encode() as arrays: the codes, and the values JSON-encoded in one blob with their offsets"""
+    encoded = [json.dumps(value, ensure_ascii=False).encode('utf-8') for value in column['values']]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return {
+        'codes': np.asarray(column['codes'], dtype=np.min_scalar_type(max(len(encoded) - 1, 0))),
+        'blob': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'offsets': offsets,
+    }
+
+
+def model_arrays(model, rep_schools):
+    """The columns of build_model() as arrays, by name, with the REP flags and the UAI lookup"""
+    locations, schools, positions = model['locations'], model['schools'], model['positions']
+    arrays = {
+        'lon': np.asarray(locations['lon'], dtype=np.float64),
+        'lat': np.asarray(locations['lat'], dtype=np.float64),
+        'vacants': np.asarray(locations['vacants'], dtype=np.int64),
+        'susceptibles': np.asarray(locations['susceptibles'], dtype=np.int64),
+        'school_start': np.asarray(locations['school_start'], dtype=np.int64),
+        'uai': np.asarray(schools['uai'], dtype=str),
+        'position_start': np.asarray(schools['position_start'], dtype=np.int64),
+    }
+    for field in ('name', 'city', 'address'):
+        for key, array in _string_arrays(schools[field]).items():
+            arrays[f'{field}.{key}'] = array
+    for field in POSITION_FIELDS:
+        for key, array in _string_arrays(positions[field]).items():
+            arrays[f'{field}.{key}'] = array
+
+    uai, school_start = arrays['uai'], arrays['school_start']
+    arrays['school_rep'] = np.isin(uai, np.asarray(list(rep_schools), dtype=str))
+    # A location is REP when one of its schools is
+    arrays['rep'] = np.zeros(len(arrays['lon']), dtype=bool)
+    has_schools = np.diff(school_start) > 0
+    if has_schools.any():
+        arrays['rep'][has_schools] = np.logical_or.reduceat(arrays['school_rep'], school_start[:-1][has_schools])
+    # UAI lookup: the schools sorted by UAI, the first one wins for duplicates
+    arrays['uai_order'] = np.argsort(uai, kind='stable')
+    arrays['sorted_uai'] = uai[arrays['uai_order']]
+    return arrays
+
+
+class Strings:
+    """A column of repeated strings: each distinct value once, in a blob, and a code per row"""
+
+    def __init__(self, arrays, name):
+        self.codes = arrays[f'{name}.codes']
+        self.blob = arrays[f'{name}.blob']
+        self.offsets = arrays[f'{name}.offsets']
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        code = self.codes[i]
+        return json.loads(self.blob[self.offsets[code]:self.offsets[code + 1]].tobytes())
+
+
+class Model:
+    """
+    The arrays of model_arrays(), possibly views of a memory-mapped file, with
+    the JSON of features and school details
+    """
+
+    def __init__(self, arrays):
+        self.lon = arrays['lon']
+        self.lat = arrays['lat']
+        self.vacants = arrays['vacants']
+        self.susceptibles = arrays['susceptibles']
+        self.school_start = arrays['school_start']
+        self.rep = arrays['rep']
+
+        self.uai = arrays['uai']
+        self.name = Strings(arrays, 'name')
+        self.city = Strings(arrays, 'city')
+        self.address = Strings(arrays, 'address')
+        self.position_start = arrays['position_start']
+        self.school_rep = arrays['school_rep']
+        self.positions = {field: Strings(arrays, field) for field in POSITION_FIELDS}
+
+        self.uai_order = arrays['uai_order']
+        self.sorted_uai = arrays['sorted_uai']
+
+    def __len__(self):
+        return len(self.lon)
+
+    def feature_json(self, i):
+        """
+        The GeoJSON of location i as the map needs it up front: id, coordinates,
+        REP flag and vacancy counts. School details are fetched when a popup opens.
+        """
+        uais = self.uai[self.school_start[i]:self.school_start[i + 1]].tolist()
+        # 6 decimals is about 10 cm
+        return ('{"type": "Feature", "id": %d, "geometry": {"type": "Point", "coordinates": [%r, %r]}, '
+                '"properties": {"uais": %s, "rep": %s, "vacants": %d, "susceptibles": %d}}') % (
+            i, round(float(self.lon[i]), 6), round(float(self.lat[i]), 6), json.dumps(uais),
+            'true' if self.rep[i] else 'false', self.vacants[i], self.susceptibles[i])
+
+    def find(self, uai):
+        """Row of a school by UAI, or None"""
+        row = int(np.searchsorted(self.sorted_uai, uai))
+        if row < len(self.sorted_uai) and self.sorted_uai[row] == uai:
+            return int(self.uai_order[row])
+        return None
+
+    def school_detail(self, row):
+        """Popup details of the school at a row"""
+        address = self.address[row]
+        positions = range(self.position_start[row], self.position_start[row + 1])
+        return {
+            "uai": str(self.uai[row]),
+            "name": self.name[row],
+            "city": self.city[row],
+            "address": address,
+            "directions_url": get_directions_url(address),
+            "positions": [{field: self.positions[field][p] for field in POSITION_FIELDS} for p in positions],
+            "rep": bool(self.school_rep[row]),
+        }
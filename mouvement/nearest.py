@@ -0,0 +1,84 @@
+"""
+Nearest locations from one or many origins, computed in batch with NumPy.
+
+Points are stored as unit vectors: the nearest points on the sphere are those
+with the largest dot product with the origin, so the candidates for all
+origins come from a single matrix product and a partial sort. Only the
+selected points get their great-circle distance computed.
+"""
+import numpy as np
+
+from mouvement.spatial import EARTH_RADIUS_KM
+
+# Limits of one query
+MAX_ORIGINS = 1000
+MAX_RESULTS = 100
+
+# Size of the (origins x points) arrays computed at once
+BLOCK_SIZE = 4_000_000
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres, element-wise over arrays of degrees"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class NearestIndex:
+    """Coordinates, vacancies and REP flags of the locations, as arrays"""
+
+    def __init__(self, points, vacants, rep):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.lat = points[:, 0]
+        self.lon = points[:, 1]
+        self.xyz = _unit_vectors(self.lat, self.lon)
+        self.vacants = np.asarray(vacants, dtype=np.int64)
+        self.rep = np.asarray(rep, dtype=bool)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def query(self, origins, n=10, vacant=True, rep=None):
+        """
+        For each (lat, lon) origin, the n nearest locations as (distance_km, id)
+        pairs, nearest first. With vacant, only locations with vacant posts are
+        considered; rep=True/False keeps only REP / non-REP locations.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        mask = np.ones(len(self), dtype=bool)
+        if vacant:
+            mask &= self.vacants > 0
+        if rep is not None:
+            mask &= self.rep == rep
+        candidates = np.flatnonzero(mask)
+        n = min(n, len(candidates))
+        if n <= 0:
+            return [[] for _ in origins]
+
+        xyz = self.xyz[candidates]
+        origins_xyz = _unit_vectors(origins[:, 0], origins[:, 1])
+        block = max(1, BLOCK_SIZE // len(candidates))
+        results = []
+        for start in range(0, len(origins), block):
+            dots = origins_xyz[start:start + block] @ xyz.T
+            if n < len(candidates):
+                top = np.argpartition(dots, -n, axis=1)[:, -n:]
+            else:
+                top = np.broadcast_to(np.arange(n), dots.shape)
+            ids = candidates[top]
+            lat, lon = origins[start:start + block, 0:1], origins[start:start + block, 1:2]
+            distances = haversine_km(lat, lon, self.lat[ids], self.lon[ids])
+            # Nearest first, ties by id
+            order = np.lexsort((ids, distances), axis=1)
+            ids = np.take_along_axis(ids, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+            results.extend(list(zip(row_distances.tolist(), row_ids.tolist()))
+                           for row_distances, row_ids in zip(distances, ids))
+        return results
@@ -0,0 +1,84 @@
+"""
+Packed snapshot files: a JSON header and raw NumPy arrays, memory-mapped
+read-only when loaded.
+
+Every process serving a snapshot maps the same file, so the arrays live once
+in the page cache and are shared by all the workers instead of being copied
+into each of them. Layout:
+
+    MAGIC | header length (8 bytes, little-endian) | header JSON | arrays
+
+The header holds the small, JSON-serializable part of the snapshot and, per
+array, its dtype, shape and offset. Arrays start on ALIGN-byte boundaries.
+"""
+import json
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'MOUVPACK'
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_packed(path, meta, arrays):
+    """Write meta (JSON-serializable) and arrays (name -> ndarray) to path, atomically"""
+    path = Path(path)
+    specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    header = json.dumps({'meta': meta, 'arrays': specs}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+        for name, array in arrays.items():
+            f.seek(start + specs[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+    return path
+
+
+def map_packed(path):
+    """The meta and arrays of a packed file; the arrays are read-only views of a shared mapping"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a packed snapshot")
+    header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length].decode('utf-8'))
+    start = _aligned(len(MAGIC) + 8 + header_length)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        count = int(np.prod(shape, dtype=np.int64))
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype=np.dtype(spec['dtype']))
+            continue
+        arrays[name] = np.frombuffer(buffer, dtype=np.dtype(spec['dtype']), count=count,
+                                     offset=start + spec['offset']).reshape(shape)
+    return header['meta'], arrays
+
+
+def section(arrays, prefix):
+    """The arrays named `prefix.<name>`, by name"""
+    prefix += '.'
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+def prefixed(prefix, arrays):
+    """The arrays renamed `prefix.<name>`"""
+    return {f'{prefix}.{name}': array for name, array in arrays.items()}
@@ -0,0 +1,85 @@
+import gzip
+import logging
+
+from flask import Response, request
+
+from mouvement.metrics import cache_hit, cache_miss
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Clients may keep the payload but must revalidate it; a repeat visit costs a 304
+CACHE_CONTROL = 'public, no-cache'
+
+
+def feature_collection(features):
+    """A FeatureCollection body from pre-serialized features, as the API serves it"""
+    return '{"type":"FeatureCollection","features":[' + ','.join(features) + ']}'
+
+
+def body_bytes(body):
+    """A payload body as bytes, copying it out if it is a view of a mapped snapshot file"""
+    return body if isinstance(body, bytes) else body.tobytes()
+
+
+def make_payload(body, content_type, etag):
+    """
+    Precompress a response body once. `etag` identifies the content (e.g. the
+    snapshot version and the resource name); each encoding gets its own strong ETag.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    encodings = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings['br'] = brotli.compress(body, quality=11)
+    return {
+        'content_type': content_type,
+        'etag': etag,
+        'encodings': encodings,
+    }
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        # If-None-Match uses the weak comparison
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == f'"{etag}"':
+            return True
+    return False
+
+
+def payload_response(payload):
+    """Serve a precompressed payload, negotiating the encoding and answering 304s"""
+    accept = request.accept_encodings
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in payload['encodings'] and accept[candidate] > 0:
+            encoding = candidate
+            break
+
+    etag = payload['etag'] if encoding == 'identity' else f"{payload['etag']}-{encoding}"
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Accept-Encoding',
+    }
+
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        cache_hit('http')
+        return Response(status=304, headers=headers)
+    cache_miss('http')
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body_bytes(payload['encodings'][encoding]), headers=headers,
+                    content_type=payload['content_type'])
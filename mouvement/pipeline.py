@@ -0,0 +1,210 @@
+"""
+Data pipeline from the mouvement PDF (or the cleaned CSV) to the served snapshot.
+
+    python -m mouvement.pipeline [--from-pdf PDF] [--annuaire FILE] [--force]
+
+Each stage records the content hashes of its inputs in .pipeline/state.json and
+is skipped when they have not changed. Intermediate tables are kept as pickles
+in .pipeline/ and passed to the next stage in memory; the CSV files of the
+manual workflow are still written for the standalone scripts.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from mouvement.data import read_positions
+from mouvement.snapshot import FORMAT, SNAPSHOT_DIR, CURRENT_FILE, build_snapshot_data, file_sha256, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = Path(os.environ.get('MOUVEMENT_PIPELINE_DIR', '.pipeline'))
+
+
+def frame_sha256(df):
+    """Content hash of a DataFrame (columns, index and values)"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def dict_sha256(data):
+    """Content hash of JSON-serializable data"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class Pipeline:
+    """Runs the stages whose inputs changed since the last run"""
+
+    def __init__(self, state_dir=STATE_DIR, force=False):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.state_file = self.state_dir / 'state.json'
+        self.state = json.loads(self.state_file.read_text(encoding='utf-8')) if self.state_file.exists() else {}
+        self.force = force
+
+    def _save_state(self):
+        tmp = self.state_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.state, indent=2, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, self.state_file)
+
+    def stage(self, name, inputs, run, load):
+        """
+        Run a stage. `inputs` maps input names to content hashes. If the stage
+        last ran with the same hashes, `load()` returns its previous result;
+        otherwise `run()` computes it and returns (result, output_hash).
+        Returns (result, output_hash) either way.
+        """
+        previous = self.state.get(name)
+        if not self.force and previous and previous['inputs'] == inputs:
+            try:
+                result = load()
+                print(f"{name}: unchanged, skipped")
+                return result, previous['output']
+            except FileNotFoundError:
+                logger.info(f"Output of stage {name} is missing, running it again")
+
+        start = time.perf_counter()
+        result, output = run()
+        self.state[name] = {'inputs': inputs, 'output': output}
+        self._save_state()
+        print(f"{name}: done in {time.perf_counter() - start:.2f}s")
+        return result, output
+
+    def frame_stage(self, name, inputs, compute):
+        """A stage producing a DataFrame, stored as a pickle between runs"""
+        path = self.state_dir / f'{name}.pkl'
+
+        def run():
+            df = compute()
+            df.to_pickle(path)
+            return df, frame_sha256(df)
+
+        return self.stage(name, inputs, run, lambda: pd.read_pickle(path))
+
+
+def extract_positions(pdf_path, workers=1, cache_dir=None):
+    """Extract the positions from the PDF and apply the cleanup of mouvement_complet_clean.csv"""
+    from extraire_mouvement import extract_mouvement
+
+    df = extract_mouvement(pdf_path, workers=workers, cache_dir=cache_dir)
+    df.to_csv('mouvement_complet.csv', index=False, encoding='utf-8-sig')
+
+    # The cleaned file drops the rank column and the header, with CRLF line ends
+    positions = df.drop(columns='Rang')
+    positions.columns = range(len(positions.columns))
+    text = positions.to_csv(sep=';', header=False, index=False, lineterminator='\r\n')
+    with open('mouvement_complet_clean.csv', 'w', encoding='utf-8', newline='') as f:
+        f.write(text.rstrip('\r\n'))
+    return positions
+
+
+def load_annuaire_data(positions, annuaire_path=None):
+    """Annuaire entries for every UAI referenced by the positions"""
+    from mouvement.annuaire import load_annuaire
+    from mouvement.data import download_schools_data, referenced_uais
+    from school_addresses import extract_uais
+
+    names = positions[2]
+    uais = set(extract_uais(names).dropna()) | referenced_uais(pd.DataFrame({'school_name': names}))
+    if annuaire_path:
+        return load_annuaire(annuaire_path, uais=uais)
+    return download_schools_data(uais=uais)
+
+
+def resolve_addresses(positions, schools_dict):
+    """The schools_with_addresses table, also written to its CSV"""
+    from school_addresses import COLUMNS, resolve_addresses as resolve
+
+    df = positions.copy()
+    df.columns = COLUMNS
+    resolve(df, schools_dict)
+    df.to_csv('schools_with_addresses.csv', sep=';', index=False, encoding='utf-8')
+    # Same dtypes as when the app reads the CSV back
+    return df.astype({'latitude': float, 'longitude': float})
+
+
+def run_pipeline(pdf_path=None, annuaire_path=None, workers=1, cache_dir=None,
+                 snapshot_dir=SNAPSHOT_DIR, force=False, state_dir=STATE_DIR):
+    """Run the pipeline and return the snapshot version"""
+    pipeline = Pipeline(state_dir, force=force)
+
+    if pdf_path:
+        positions, positions_hash = pipeline.frame_stage(
+            'positions', {'pdf': file_sha256(pdf_path)},
+            lambda: extract_positions(pdf_path, workers=workers, cache_dir=cache_dir))
+    else:
+        positions, positions_hash = pipeline.frame_stage(
+            'positions', {'mouvement_complet_clean.csv': file_sha256('mouvement_complet_clean.csv')},
+            read_positions)
+
+    # The annuaire has its own cache (see download_schools_data); only its content is tracked
+    schools_dict = load_annuaire_data(positions, annuaire_path)
+    annuaire_hash = dict_sha256(schools_dict)
+
+    addresses, addresses_hash = pipeline.frame_stage(
+        'addresses', {'positions': positions_hash, 'annuaire': annuaire_hash},
+        lambda: resolve_addresses(positions, schools_dict))
+
+    snapshot_dir = Path(snapshot_dir)
+
+    def build():
+        data = build_snapshot_data(positions=positions, addresses=addresses, schools_dict=schools_dict)
+        write_snapshot(data, snapshot_dir)
+        return data['version'], data['version']
+
+    def reuse():
+        version = pipeline.state['snapshot']['output']
+        filename = f"mouvement-{version}.json"
+        if not (snapshot_dir / filename).exists():
+            raise FileNotFoundError(filename)
+        current = snapshot_dir / CURRENT_FILE
+        if not current.exists() or current.read_text(encoding='utf-8').strip() != filename:
+            tmp = current.with_suffix('.tmp')
+            tmp.write_text(filename + '\n', encoding='utf-8')
+            os.replace(tmp, current)
+        return version
+
+    version, _ = pipeline.stage(
+        'snapshot',
+        {
+            'format': str(FORMAT),
+            'positions': positions_hash,
+            'addresses': addresses_hash,
+            'annuaire': annuaire_hash,
+            'REP_Toulouse.csv': file_sha256('REP_Toulouse.csv'),
+        },
+        build, reuse)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the served data, skipping unchanged stages")
+    parser.add_argument('--from-pdf', metavar='PDF',
+                        help="Extract the positions from this PDF instead of reading mouvement_complet_clean.csv")
+    parser.add_argument('--annuaire', metavar='FILE',
+                        help="Local annuaire export (JSON or GeoJSON) instead of the education.gouv.fr API")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to extract the PDF pages (0: one per CPU, default: %(default)s)")
+    parser.add_argument('--pdf-cache-dir', default=str(STATE_DIR / 'pages'),
+                        help="Per-page extraction cache (default: %(default)s)")
+    parser.add_argument('--output-dir', default=str(SNAPSHOT_DIR),
+                        help="Directory where snapshots are written (default: %(default)s)")
+    parser.add_argument('--force', action='store_true', help="Run every stage")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    version = run_pipeline(pdf_path=args.from_pdf, annuaire_path=args.annuaire,
+                           workers=args.workers or None, cache_dir=args.pdf_cache_dir,
+                           snapshot_dir=args.output_dir, force=args.force)
+    print(f"Serving snapshot {version}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,112 @@
 import os
+import atexit
 import logging
+import logging.handlers
+import queue
+import signal
+import socket
+import time
 from waitress import serve
-from mouvement.app import app
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('mouvement.log'),
-        logging.StreamHandler()
-    ]
-)
+from mouvement.app import app, catalog
+
+# Set up logging: request threads only enqueue records, a listener thread
+# formats them and writes to the file and the console
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('mouvement.log')
+file_handler.setFormatter(formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# The queued records carry the bare message, formatted once by the listener
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger('mouvement')
 
+# The listener thread does not survive a fork: stop it around it and restart
+# it on both sides, each process then writes its own records
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=log_listener.stop, after_in_parent=log_listener.start,
+                        after_in_child=log_listener.start)
+
+# Worker processes serving the same socket
+WORKERS = int(os.environ.get('MOUVEMENT_WORKERS', '1'))
+
+
+def notify_systemd(state):
+    """Send a state such as READY=1 to systemd when run as a Type=notify service"""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address or not hasattr(socket, 'AF_UNIX'):
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        sock.sendall(state.encode('utf-8'))
+
+
+def serve_worker(sock):
+    """Run in a forked worker: serve the shared socket until terminated"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        serve(app, sockets=[sock])
+    except Exception as e:
+        logger.error(f"Worker {os.getpid()} failed: {str(e)}", exc_info=True)
+        status = 1
+    finally:
+        log_listener.stop()
+        os._exit(status)
+
+
+def serve_workers(sock, workers):
+    """
+    Serve from several processes forked after the snapshot is loaded, so they
+    share its memory-mapped arrays. Each worker reloads new snapshots on its
+    own; dead workers are replaced.
+    """
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            serve_worker(sock)
+        children.add(pid)
+        logger.info(f"Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+            # Do not spin if workers keep failing at startup
+            time.sleep(1)
+            spawn()
+    sock.close()
+
 if __name__ == '__main__':
     try:
         # Get port from environment variable or default to 8081
@@ -26,7 +119,18 @@ if __name__ == '__main__':
         logger.info(f"Working directory: {os.getcwd()}")
         logger.info(f"Environment variables: FLASK_SECRET_KEY={'*' * 32 if os.environ.get('FLASK_SECRET_KEY') else 'Not set'}")
         
-        serve(app, host=host, port=port)
+        # Load the default dataset before accepting requests, the others on first use
+        snapshot = catalog.get()
+        logger.info(f"Serving snapshot {snapshot['version']}")
+
+        # Ready once the data is loaded and the socket is listening
+        sock = socket.create_server((host, port), backlog=1024)
+        notify_systemd('READY=1')
+        if WORKERS > 1 and hasattr(os, 'fork'):
+            logger.info(f"Serving with {WORKERS} worker processes")
+            serve_workers(sock, WORKERS)
+        else:
+            serve(app, sockets=[sock])
     except Exception as e:
         logger.error(f"Failed to start server: {str(e)}", exc_info=True)
         raise 
\ No newline at end of file
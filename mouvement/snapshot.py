@@ -0,0 +1,302 @@
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mouvement.clusters import ClusterIndex, build_clusters, cluster_arrays
+from mouvement.facets import FacetIndex, build_facets, facet_arrays
+from mouvement.metrics import stage_timer
+from mouvement.model import Model, build_model, model_arrays
+from mouvement.nearest import NearestIndex
+from mouvement.packed import map_packed, prefixed, section, write_packed
+from mouvement.payload import feature_collection, make_payload
+from mouvement.spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+# Source files the snapshot is built from (relative to the working directory)
+SOURCE_FILES = [
+    'mouvement_complet_clean.csv',
+    'schools_with_addresses.csv',
+    'schools_data_cache.pickle',
+    'REP_Toulouse.csv',
+]
+
+# Bumped when the snapshot layout changes; older snapshots are not loaded
+FORMAT = 6
+
+# Number of school detail responses kept per snapshot
+DETAIL_CACHE_SIZE = 512
+
+SNAPSHOT_DIR = Path(os.environ.get('MOUVEMENT_SNAPSHOT_DIR', 'snapshots'))
+CURRENT_FILE = 'CURRENT'
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 of a file, or None if it does not exist"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_snapshot_data(positions=None, addresses=None, schools_dict=None,
+                        rep_path='REP_Toulouse.csv', source_files=SOURCE_FILES):
+    """
+    Run the full load (CSVs, annuaire, REP list) once and return the snapshot
+    content as a dict. The version is a hash of the served content, so two
+    builds from the same data give the same version. The inputs can be passed
+    in memory, see load_schools(); `source_files` are the files whose hashes
+    are recorded, for datasets of the catalog that live elsewhere.
+    """
+    from mouvement.data import load_schools, load_rep_schools, load_rep_status, read_addresses
+
+    if addresses is None:
+        addresses = read_addresses()
+    schools, stats, _ = load_schools(positions=positions, addresses=addresses, schools_dict=schools_dict)
+    rep_schools = load_rep_schools(rep_path)
+
+    # Stable feature ids, used by the query API and the map
+    for i, feature in enumerate(schools['features']):
+        feature['id'] = i
+
+    content = {
+        "model": build_model(schools['features']),
+        "stats": stats,
+        "rep_schools": rep_schools,
+    }
+    with stage_timer('clusters'):
+        content["clusters"] = build_clusters(schools['features'])
+    with stage_timer('facets'):
+        content["facets"] = build_facets(addresses, schools['features'], load_rep_status(rep_path))
+    canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+    return {
+        "format": FORMAT,
+        "version": version,
+        "built_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "sources": {str(name): file_sha256(name) for name in source_files},
+        **content,
+    }
+
+
+def packed_path(path):
+    """The packed file of a snapshot, served memory-mapped (see mouvement/packed.py)"""
+    return Path(path).with_suffix('.bin')
+
+
+def write_snapshot(data, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Write a snapshot as an immutable, content-hashed file, with its packed
+    file, and point CURRENT at it. All writes go through a temporary file and
+    os.replace so readers never see a partial file.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    filename = f"mouvement-{data['version']}.json"
+    path = snapshot_dir / filename
+    if not path.exists():
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+    if not packed_path(path).exists():
+        write_packed(packed_path(path), *pack(data))
+
+    current = snapshot_dir / CURRENT_FILE
+    tmp = current.with_suffix('.tmp')
+    tmp.write_text(filename + '\n', encoding='utf-8')
+    os.replace(tmp, current)
+
+    logger.info(f"Snapshot {data['version']} written to {path}")
+    return path
+
+
+def pack(data):
+    """
+    Split the snapshot content into what is served as arrays (the model, facet
+    and cluster indexes, compressed payloads), by name, and the small rest, as
+    stored in the packed file
+    """
+    version = data['version']
+    arrays = {}
+    arrays.update(prefixed('model', model_arrays(data['model'], data['rep_schools'])))
+    facet_values, facets = facet_arrays(data['facets'])
+    arrays.update(prefixed('facets', facets))
+    arrays.update(prefixed('clusters', cluster_arrays(data['clusters'])))
+
+    model = Model(section(arrays, 'model'))
+    with stage_timer('serialization'):
+        map_geojson = feature_collection(model.feature_json(i) for i in range(len(model)))
+        payloads = {
+            "schools": make_payload(map_geojson, 'application/geo+json', f"{version}-schools"),
+            "rep": make_payload(json.dumps(data['rep_schools']), 'application/json', f"{version}-rep"),
+        }
+    for name, payload in payloads.items():
+        for encoding, body in payload['encodings'].items():
+            arrays[f'payloads.{name}.{encoding}'] = np.frombuffer(body, dtype=np.uint8)
+
+    meta = {
+        "format": data['format'],
+        "version": version,
+        "built_at": data.get('built_at'),
+        "stats": data['stats'],
+        "facets": facet_values,
+        "clusters": {"min_zoom": data['clusters']['min_zoom'], "max_zoom": data['clusters']['max_zoom']},
+        "payloads": {name: {"content_type": payload['content_type'], "etag": payload['etag']}
+                     for name, payload in payloads.items()},
+    }
+    return meta, arrays
+
+
+def prepare(meta, arrays):
+    """
+    Precompute everything a request needs from a packed snapshot. The arrays
+    are used as they are, so a mapped file is shared rather than copied.
+    """
+    model = Model(section(arrays, 'model'))
+
+    @functools.lru_cache(maxsize=DETAIL_CACHE_SIZE)
+    def detail_json(uai):
+        """JSON details of a school, or None if unknown"""
+        row = model.find(uai)
+        return json.dumps(model.school_detail(row)) if row is not None else None
+
+    spatial = GridIndex(np.column_stack([model.lat, model.lon]))
+    payloads = {}
+    for name, payload in meta['payloads'].items():
+        encodings = section(arrays, f'payloads.{name}')
+        payloads[name] = {**payload, "encodings": encodings}
+    return {
+        "version": meta['version'],
+        "built_at": meta.get('built_at'),
+        "stats": meta['stats'],
+        "bounds": spatial.bounds(),
+        "spatial": spatial,
+        "model": model,
+        "clusters": ClusterIndex(meta['clusters']['min_zoom'], meta['clusters']['max_zoom'],
+                                 section(arrays, 'clusters'), model.feature_json, spatial),
+        "facets": FacetIndex(meta['facets'], section(arrays, 'facets')),
+        "nearest": NearestIndex(spatial.points, model.vacants, model.rep),
+        "detail_json": detail_json,
+        "payloads": payloads,
+    }
+
+
+class SnapshotStore:
+    """
+    Holds the current snapshot in memory. The CURRENT pointer is stat'ed on each
+    access and the snapshot is reloaded only when it changes. If no snapshot has
+    been built, the data is built in memory once instead, unless build_missing
+    is False: get() then raises FileNotFoundError.
+    """
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, build_missing=True):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.build_missing = build_missing
+        # Size of the loaded snapshot file, the catalog weighs the stores with it
+        self.size = 0
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stamp = None
+
+    @property
+    def snapshot(self):
+        """The snapshot in memory, without checking for a newer one (None before get())"""
+        return self._snapshot
+
+    def _current_stamp(self):
+        try:
+            st = (self.snapshot_dir / CURRENT_FILE).stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        filename = (self.snapshot_dir / CURRENT_FILE).read_text(encoding='utf-8').strip()
+        path = self.snapshot_dir / filename
+        if packed_path(path).exists():
+            # Read-only mapping, shared with the other processes serving it
+            meta, arrays = map_packed(packed_path(path))
+            size = packed_path(path).stat().st_size
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            meta, arrays = pack(data) if data.get('format') == FORMAT else (data, {})
+            size = sum(array.nbytes for array in arrays.values())
+        if meta.get('format') != FORMAT:
+            raise ValueError(f"{filename} has an outdated format, rebuild it with python -m mouvement.snapshot")
+        snapshot = prepare(meta, arrays)
+        logger.info(f"Loaded snapshot {meta['version']} from {path}")
+        self.size = size
+        return snapshot
+
+    def get(self):
+        stamp = self._current_stamp()
+        if self._snapshot is not None and stamp == self._stamp:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is not None and stamp == self._stamp:
+                return self._snapshot
+            if stamp is not None:
+                try:
+                    self._snapshot = self._load()
+                    self._stamp = stamp
+                    return self._snapshot
+                except Exception as e:
+                    logger.error(f"Error loading snapshot: {str(e)}")
+                    if self._snapshot is not None:
+                        return self._snapshot
+            if self._snapshot is None:
+                if not self.build_missing:
+                    raise FileNotFoundError(f"No snapshot in {self.snapshot_dir}")
+                logger.warning("No snapshot found, building data in memory")
+                self._snapshot = prepare(*pack(build_snapshot_data()))
+                self._watch_refreshes()
+            self._stamp = stamp
+            return self._snapshot
+
+    def _watch_refreshes(self):
+        """Rebuild the in-memory data when the annuaire cache is refreshed"""
+        from mouvement.data import add_refresh_listener
+        add_refresh_listener(self._rebuild_in_memory)
+
+    def _rebuild_in_memory(self):
+        # Runs in the refresh thread; requests keep the old data meanwhile
+        if self._stamp is not None:
+            return
+        snapshot = prepare(*pack(build_snapshot_data()))
+        with self._lock:
+            if self._stamp is None:
+                self._snapshot = snapshot
+                logger.info(f"Rebuilt in-memory data {snapshot['version']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the served data snapshot")
+    parser.add_argument('--output-dir', default=str(SNAPSHOT_DIR),
+                        help="Directory where snapshots are written (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    data = build_snapshot_data()
+    path = write_snapshot(data, args.output_dir)
+    print(f"Snapshot {data['version']} written to {path}")
+
+
+if __name__ == '__main__':
+    main()
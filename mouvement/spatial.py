@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# About 5.5 km of latitude per cell
+DEFAULT_CELL_SIZE = 0.05
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between two (lat, lon) points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid over an array of (lat, lon) points. The point ids
+    (positions in the array) are sorted by cell, so the points of a row of
+    cells are one slice and a query only looks at the cells overlapping the
+    search area. Everything is held in a few arrays.
+    """
+
+    def __init__(self, points, cell_size=DEFAULT_CELL_SIZE):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.lat = self.points[:, 0]
+        self.lon = self.points[:, 1]
+        self.cell_size = cell_size
+        rows = np.floor(self.lat / cell_size).astype(np.int64)
+        cols = np.floor(self.lon / cell_size).astype(np.int64)
+        self.row_min = int(rows.min()) if len(rows) else 0
+        self.col_min = int(cols.min()) if len(cols) else 0
+        self.width = int(cols.max()) - self.col_min + 1 if len(cols) else 1
+        self.height = int(rows.max()) - self.row_min + 1 if len(rows) else 0
+        cells = (rows - self.row_min) * self.width + (cols - self.col_min)
+        self.ids = np.argsort(cells, kind='stable')
+        self.cells = cells[self.ids]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def bounds(self):
+        """(min_lon, min_lat, max_lon, max_lat) of all points, or None if empty"""
+        if not len(self.points):
+            return None
+        return (float(self.lon.min()), float(self.lat.min()), float(self.lon.max()), float(self.lat.max()))
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """Ids of the points inside the box (edges included), in ascending order"""
+        if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+            raise ValueError("bbox must be finite numbers")
+        if min_lon > max_lon or min_lat > max_lat or not len(self.points):
+            return []
+        # Cells of the box clamped to just past the grid, so that a huge finite bound cannot overflow
+        lat_low, lat_high = (self.row_min - 1) * self.cell_size, (self.row_min + self.height) * self.cell_size
+        lon_low, lon_high = (self.col_min - 1) * self.cell_size, (self.col_min + self.width) * self.cell_size
+        row_min, col_min = self._cell(min(max(min_lat, lat_low), lat_high), min(max(min_lon, lon_low), lon_high))
+        row_max, col_max = self._cell(min(max(max_lat, lat_low), lat_high), min(max(max_lon, lon_low), lon_high))
+        # Relative to the grid, clipped to it
+        row_min, row_max = max(row_min - self.row_min, 0), min(row_max - self.row_min, self.height - 1)
+        col_min, col_max = max(col_min - self.col_min, 0), min(col_max - self.col_min, self.width - 1)
+        if row_min > row_max or col_min > col_max:
+            return []
+
+        rows = np.arange(row_min, row_max + 1) * self.width
+        starts = np.searchsorted(self.cells, rows + col_min, side='left')
+        ends = np.searchsorted(self.cells, rows + col_max, side='right')
+        ids = np.concatenate([self.ids[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+        lat, lon = self.lat[ids], self.lon[ids]
+        inside = (min_lat <= lat) & (lat <= max_lat) & (min_lon <= lon) & (lon <= max_lon)
+        return np.sort(ids[inside]).tolist()
+
+    def query_radius(self, lat, lon, radius_km):
+        """Ids of the points within radius_km of (lat, lon), nearest first"""
+        if not all(math.isfinite(v) for v in (lat, lon, radius_km)):
+            raise ValueError("near and radius_km must be finite numbers")
+        if radius_km < 0:
+            return []
+        dlat = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlon = min(180.0, dlat / cos_lat)
+        matches = []
+        for i in self.query_bbox(lon - dlon, lat - dlat, lon + dlon, lat + dlat):
+            distance = haversine_km(lat, lon, float(self.lat[i]), float(self.lon[i]))
+            if distance <= radius_km:
+                matches.append((distance, i))
+        matches.sort()
+        return [i for _, i in matches]
@@ -1,154 +1,93 @@
+import argparse
+import logging
+
 import pandas as pd
-import json
-import re
 
-def extract_uai(school_name):
-    """
-    Extract the UAI code from the school name
-    """
-    # Look for pattern like (0310160f) or 0310160f at the end of the name
-    match = re.search(r'[(\s]([0-9]{7}[A-Za-z])[)\s]?', school_name)
-    if match:
-        return match.group(1)
-    return None
+from mouvement.annuaire import load_annuaire
 
-def load_schools_data():
+logger = logging.getLogger(__name__)
+
+# Column names of mouvement_complet_clean.csv, which has no header
+COLUMNS = ['code', 'city', 'school_name', 'type', 'nature',
+           'specialization', 'num_vacant', 'num_potential']
+
+def load_schools_data(uais=None, departement=None):
     """
-    Load the schools data from the GeoJSON file
+    Load the schools data from the GeoJSON file, keeping only the schools in
+    `uais` (and in `departement`, if given). The file is streamed record by record.
     """
     print("Loading schools data from GeoJSON file...")
-    with open('fr-en-annuaire-education.geojson', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Create a dictionary for quick lookup by UAI code
-    schools_dict = {}
-    for feature in data['features']:
-        properties = feature['properties']
-        uai = properties.get('identifiant_de_l_etablissement')
-        if uai:
-            # Convert UAI to uppercase for consistency
-            uai = uai.upper()
-            # Combine address fields, handling None values
-            address_parts = []
-            for i in range(1, 4):
-                addr = properties.get(f'adresse_{i}')
-                if addr and addr != 'None':
-                    address_parts.append(addr)
-            
-            # Get and validate coordinates
-            try:
-                lat = float(properties.get('latitude', ''))
-                lon = float(properties.get('longitude', ''))
-                # Basic validation of coordinates for France
-                if not (41 <= lat <= 52 and -5 <= lon <= 10):
-                    lat, lon = None, None
-            except (ValueError, TypeError):
-                lat, lon = None, None
-            
-            schools_dict[uai] = {
-                'address': ' '.join(address_parts),
-                'postal_code': properties.get('code_postal', ''),
-                'commune': properties.get('nom_commune', ''),
-                'type': properties.get('type_etablissement', ''),
-                'name': properties.get('nom_etablissement', ''),
-                'latitude': lat,
-                'longitude': lon
-            }
+    schools_dict = load_annuaire('fr-en-annuaire-education.geojson', uais=uais, departement=departement)
     
     print(f"Loaded {len(schools_dict)} schools")
     return schools_dict
 
-def get_school_data(school_name, schools_dict):
+def annuaire_table(schools_dict):
     """
-    Get the school data from the loaded data
+    The annuaire as a DataFrame with one row per UAI and the address already
+    formatted the way it is written to schools_with_addresses.csv
     """
-    try:
-        # Extract UAI code
-        uai = extract_uai(school_name)
-        if not uai:
-            print(f"  No UAI code found in: {school_name}")
-            return None
-            
-        print(f"  Looking for UAI: {uai}")
-        
-        # Convert UAI to uppercase for comparison
-        uai = uai.upper()
-        
-        # Look up the school in our dictionary (try both upper and lower case)
-        school_data = schools_dict.get(uai) or schools_dict.get(uai.lower())
-        if school_data:
-            print(f"  Found school: {school_data['name']}")
-            print(f"  Type: {school_data['type']}")
-            if school_data['latitude'] is not None and school_data['longitude'] is not None:
-                print(f"  Coordinates: {school_data['latitude']}, {school_data['longitude']}")
-            else:
-                print("  No valid coordinates found")
-            return school_data
-        
-        print("  No matching school found with this UAI")
-        return None
-    
-    except Exception as e:
-        print(f"  Error occurred: {str(e)}")
-        return None
+    return pd.DataFrame(
+        [(uai, f"{school['address']}, {school['postal_code']} {school['commune']}",
+          school['latitude'], school['longitude'], school['type'])
+         for uai, school in schools_dict.items()],
+        columns=['uai', 'address', 'latitude', 'longitude', 'school_type']
+    )
 
-def main():
-    # Load the schools data
-    schools_dict = load_schools_data()
-    
-    # Read the CSV file without headers
-    # Note: The file uses semicolon as separator
-    df = pd.read_csv('mouvement_complet_clean.csv', sep=';', encoding='utf-8', header=None)
+def extract_uais(school_names):
+    """The UAI codes in the school names, e.g. (0310160f) or 0310160f at the end, upper-cased"""
+    return school_names.str.extract(r'[(\s]([0-9]{7}[A-Za-z])[)\s]?', expand=False).str.upper()
+
+def resolve_addresses(df, schools_dict, verbose=False):
+    """
+    Add the address, latitude, longitude and school_type columns to the
+    mouvement rows from the annuaire. Returns the statistics.
+    """
+    uais = extract_uais(df['school_name'])
     
-    # Rename columns to meaningful names
-    df.columns = ['code', 'city', 'school_name', 'type', 'nature',
-                  'specialization', 'num_vacant', 'num_potential']
+    # Join every row to the annuaire; a left merge keeps the row order
+    matched = uais.to_frame('uai').merge(annuaire_table(schools_dict), on='uai', how='left')
+    found = matched['address'].notna()
+    with_coords = found & matched['latitude'].notna() & matched['longitude'].notna()
     
     # Create new columns for school data
-    df['address'] = ''
-    df['latitude'] = pd.NA
-    df['longitude'] = pd.NA
-    df['school_type'] = ''
+    df['address'] = matched['address'].where(found, '').values
+    df['latitude'] = matched['latitude'].where(with_coords).values
+    df['longitude'] = matched['longitude'].where(with_coords).values
+    df['school_type'] = matched['school_type'].where(found, '').values
     
-    # Statistics tracking
+    # Statistics
+    no_uai = uais.isna()
     stats = {
         'total': len(df),
-        'found': 0,
-        'found_with_coords': 0,
-        'not_found': 0,
+        'found': int(found.sum()),
+        'found_with_coords': int(with_coords.sum()),
+        'not_found': int((~found & ~no_uai).sum()),
         'error': 0,
-        'no_uai': 0
+        'no_uai': int(no_uai.sum())
     }
     
-    # Process all rows
-    for index, row in df.iterrows():
-        school_name = row['school_name']
-        city = row['city']
-        
-        print(f"\nProcessing: {school_name} in {city}")
-        
-        # Get school data
-        school_data = get_school_data(school_name, schools_dict)
-        
-        if school_data:
-            # Update statistics
-            stats['found'] += 1
-            
-            # Store the data
-            df.at[index, 'address'] = f"{school_data['address']}, {school_data['postal_code']} {school_data['commune']}"
-            
-            # Only store coordinates if they are valid
-            if school_data['latitude'] is not None and school_data['longitude'] is not None:
-                df.at[index, 'latitude'] = school_data['latitude']
-                df.at[index, 'longitude'] = school_data['longitude']
-                stats['found_with_coords'] += 1
-            
-            df.at[index, 'school_type'] = school_data['type']
-        else:
-            if extract_uai(school_name) is None:
-                stats['no_uai'] += 1
-            else:
-                stats['not_found'] += 1
+    if verbose:
+        for name in df.loc[no_uai.values, 'school_name']:
+            logger.info(f"No UAI code found in: {name}")
+        for name, uai in zip(df.loc[(~found & ~no_uai).values, 'school_name'], uais[~found & ~no_uai]):
+            logger.info(f"No matching school found for UAI {uai}: {name}")
+        for name in df.loc[(found & ~with_coords).values, 'school_name']:
+            logger.info(f"No valid coordinates found for: {name}")
+    
+    return stats
+
+def main(verbose=False):
+    # Read the CSV file without headers
+    # Note: The file uses semicolon as separator
+    df = pd.read_csv('mouvement_complet_clean.csv', sep=';', encoding='utf-8', header=None)
+    
+    # Rename columns to meaningful names
+    df.columns = COLUMNS
+    
+    # Load the schools data, keeping only the UAIs referenced in the CSV
+    schools_dict = load_schools_data(uais=set(extract_uais(df['school_name']).dropna()))
+    stats = resolve_addresses(df, schools_dict, verbose=verbose)
     
     # Save results to a new CSV file
     df.to_csv('schools_with_addresses.csv', sep=';', index=False, encoding='utf-8')
@@ -167,4 +106,9 @@ def main():
     print("\nProcessing complete! Results saved to 'schools_with_addresses.csv'")
 
 if __name__ == "__main__":
-    main() 
+    parser = argparse.ArgumentParser(description="Add annuaire addresses and coordinates to the mouvement CSV")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Log the rows without UAI, without a match or without coordinates")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main(verbose=args.verbose)
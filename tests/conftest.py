@@ -0,0 +1,38 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The tests import the project packages (mouvement, benchmarks, school_addresses) from the checkout
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """A small synthetic dataset (see benchmarks/synthetic.py), in the working directory"""
+    from benchmarks.synthetic import generate
+
+    previous = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        yield generate(tmp_path, 300, seed=1)
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture
+def client(dataset, tmp_path, monkeypatch):
+    """A test client of the app serving a snapshot of the synthetic dataset"""
+    from mouvement import app as app_module
+    from mouvement.annuaire import load_annuaire
+    from mouvement.catalog import Catalog
+    from mouvement.data import read_addresses, read_positions
+    from mouvement.snapshot import build_snapshot_data, write_snapshot
+
+    data = build_snapshot_data(positions=read_positions(), addresses=read_addresses(),
+                               schools_dict=load_annuaire(dataset['annuaire']))
+    write_snapshot(data, tmp_path / 'snapshots')
+    monkeypatch.setattr(app_module, 'catalog', Catalog(tmp_path / 'datasets.json', tmp_path / 'snapshots'))
+    return app_module.app.test_client()
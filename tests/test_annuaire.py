@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+from mouvement.annuaire import iter_annuaire_records, load_annuaire
+
+RECORDS = [
+    {'identifiant_de_l_etablissement': '0310001A', 'code_departement': '031', 'nom_etablissement': 'École A',
+     'adresse_1': '1 rue A', 'adresse_2': None, 'code_postal': '31000', 'nom_commune': 'Toulouse',
+     'type_etablissement': 'Ecole', 'latitude': 43.6, 'longitude': 1.44, 'date_maj_ligne': '2025-03-01'},
+    {'identifiant_de_l_etablissement': '0310002b', 'code_departement': '031', 'nom_etablissement': 'École B',
+     'adresse_1': '2 rue B', 'code_postal': '31500', 'nom_commune': 'Toulouse',
+     'type_etablissement': 'Ecole', 'latitude': 'x', 'longitude': 1.45, 'date_maj_ligne': '2025-04-02'},
+    {'identifiant_de_l_etablissement': '0810001C', 'code_departement': '081', 'nom_etablissement': 'École C',
+     'adresse_1': '3 rue C', 'code_postal': '81000', 'nom_commune': 'Albi',
+     'type_etablissement': 'Ecole', 'latitude': 43.93, 'longitude': 2.15, 'date_maj_ligne': '2025-02-15'},
+    {'nom_etablissement': 'Sans UAI', 'code_departement': '031'},
+]
+
+
+def geojson(records):
+    return {'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'geometry': None, 'properties': record} for record in records]}
+
+
+@pytest.fixture(params=['json', 'geojson'])
+def annuaire_file(request, tmp_path):
+    """The records above as a JSON export or a GeoJSON export"""
+    path = tmp_path / f'annuaire.{request.param}'
+    data = RECORDS if request.param == 'json' else geojson(RECORDS)
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def test_load_everything(annuaire_file):
+    info = {}
+    schools = load_annuaire(annuaire_file, info=info)
+
+    assert sorted(schools) == ['0310001A', '0310002B', '0810001C']
+    assert schools['0310001A'] == {'address': '1 rue A', 'postal_code': '31000', 'commune': 'Toulouse',
+                                   'type': 'Ecole', 'name': 'École A', 'latitude': 43.6, 'longitude': 1.44}
+    assert schools['0310002B']['latitude'] is None and schools['0310002B']['longitude'] is None
+    assert info == {'scanned': 4, 'latest_update': '2025-04-02'}
+
+
+def test_uai_filter(annuaire_file):
+    schools = load_annuaire(annuaire_file, uais=['0310002B', '0810001c', '9999999Z'])
+    assert sorted(schools) == ['0310002B', '0810001C']
+
+
+@pytest.mark.parametrize('departement', ['31', '031'])
+def test_departement_filter(annuaire_file, departement):
+    assert sorted(load_annuaire(annuaire_file, departement=departement)) == ['0310001A', '0310002B']
+
+
+def test_both_filters(annuaire_file):
+    schools = load_annuaire(annuaire_file, uais=['0310001A', '0810001C'], departement='81')
+    assert list(schools) == ['0810001C']
+
+
+@pytest.mark.parametrize('kind', ['json', 'geojson'])
+def test_records_across_chunks(kind):
+    # Chunks smaller than a record split keys, strings and numbers
+    data = json.dumps(RECORDS if kind == 'json' else geojson(RECORDS), indent=1)
+    assert list(iter_annuaire_records(io.StringIO(data), chunk_size=7)) == RECORDS
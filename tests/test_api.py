@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    'bbox=-inf,43,inf,44',
+    'bbox=nan,43,2,44',
+    'bbox=0,-100,2,44',
+    'near=inf,1&radius_km=2',
+    'near=nan,1',
+    'near=95,1',
+    'near=43,1&radius_km=inf',
+    'near=43,1&radius_km=nan',
+])
+def test_schools_rejects_invalid_numbers(client, query):
+    response = client.get(f'/api/schools?{query}')
+    assert response.status_code == 400
+    assert 'convert' not in response.get_json()['error']
+
+
+def test_schools_huge_finite_bbox(client):
+    locations = client.get('/api/schools?bbox=-180,-90,180,90').get_json()['features']
+    response = client.get('/api/schools?bbox=-1e308,-90,1e308,90')
+    assert response.status_code == 200
+    assert response.get_json()['features'] == locations
+
+
+def test_schools_bbox_and_near(client):
+    features = client.get('/api/schools?bbox=-180,-90,180,90').get_json()['features']
+    assert features
+    lon, lat = features[0]['geometry']['coordinates']
+    near = client.get(f'/api/schools?near={lat},{lon}&radius_km=1').get_json()['features']
+    assert near[0]['geometry']['coordinates'] == [lon, lat]
+
+
+@pytest.mark.parametrize('query', [
+    'z=5&bbox=nan,43,2,44',
+    'z=5&bbox=-inf,43,inf,44',
+    'z=18&bbox=-inf,43,inf,44',
+    'z=5&bbox=0,43,2',
+    'z=x&bbox=0,43,2,44',
+])
+def test_clusters_rejects_invalid_parameters(client, query):
+    assert client.get(f'/api/clusters?{query}').status_code == 400
+
+
+def test_clusters_cover_every_location(client):
+    locations = len(client.get('/api/schools?bbox=-180,-90,180,90').get_json()['features'])
+    for zoom in (0, 8, 17, 18):
+        for bbox in ('-180,-90,180,90', '-1e308,-90,1e308,90'):
+            response = client.get(f'/api/clusters?z={zoom}&bbox={bbox}')
+            assert response.status_code == 200
+            features = response.get_json()['features']
+            assert sum(f['properties'].get('point_count', 1) for f in features) == locations
+
+
+def test_full_payload_matches_bbox_query(client):
+    everything = client.get('/api/schools.geojson', headers={'Accept-Encoding': 'identity'})
+    assert everything.data == client.get('/api/schools?bbox=-180,-90,180,90').data
@@ -0,0 +1,38 @@
+import json
+
+import pandas as pd
+
+from mouvement.catalog import Catalog, build_catalog, diff_path, diff_posts, post_table
+from mouvement.data import read_positions
+
+
+def write_catalog(path):
+    path.write_text(json.dumps({'default': 'b', 'datasets': [
+        {'id': 'a', 'positions': 'a.csv', 'addresses': 'schools_with_addresses.csv'},
+        {'id': 'b', 'positions': 'b.csv', 'addresses': 'schools_with_addresses.csv'},
+    ]}), encoding='utf-8')
+
+
+def set_vacants(source, target, rows):
+    positions = pd.read_csv(source, sep=';', header=None, encoding='utf-8')
+    positions.loc[:rows - 1, 6] = positions.loc[:rows - 1, 6] + 1
+    positions.to_csv(target, sep=';', header=False, index=False, encoding='utf-8')
+
+
+def test_diff_follows_positions_files(dataset, tmp_path):
+    positions = dataset['positions']
+    set_vacants(positions, tmp_path / 'a.csv', 0)
+    set_vacants(positions, tmp_path / 'b.csv', 10)
+    write_catalog(tmp_path / 'datasets.json')
+    build_catalog(tmp_path / 'datasets.json', tmp_path / 'snapshots', dataset['annuaire'])
+    catalog = Catalog(tmp_path / 'datasets.json', tmp_path / 'snapshots')
+    first = catalog.diff('a', 'b')
+
+    # Vacancy counts changed in more rows: same snapshot versions, new diff
+    set_vacants(positions, tmp_path / 'b.csv', 100)
+    build_catalog(tmp_path / 'datasets.json', tmp_path / 'snapshots', dataset['annuaire'])
+    with open(diff_path(tmp_path / 'snapshots', 'a', 'b'), encoding='utf-8') as f:
+        stored = json.load(f)
+    expected = diff_posts(post_table(read_positions('a.csv')), post_table(read_positions('b.csv')))
+    assert stored['summary'] == expected['summary']
+    assert catalog.diff('a', 'b')['etag'] != first['etag']
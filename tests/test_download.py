@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mouvement import data
+
+ETAG = '"annuaire-v1"'
+
+
+def record(uai, name, updated):
+    return {'identifiant_de_l_etablissement': uai, 'code_departement': '031', 'nom_etablissement': name,
+            'adresse_1': f'rue {name}', 'code_postal': '31000', 'nom_commune': 'Toulouse',
+            'type_etablissement': 'Ecole', 'latitude': 43.6, 'longitude': 1.44, 'date_maj_ligne': updated}
+
+
+FULL = [record('0310001A', 'A', '2025-03-01'), record('0310002B', 'B', '2025-04-01')]
+UPDATED = [record('0310002B', 'B bis', '2025-05-02'), record('0310003C', 'C', '2025-05-01')]
+
+
+class Annuaire:
+    """A local stand-in for the annuaire export API, recording the requests it gets"""
+
+    def __init__(self):
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def respond(self, handler):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query)
+        self.requests.append({'where': query.get('where', [None])[0],
+                              'if_none_match': handler.headers.get('If-None-Match')})
+        # Lets a test hold the response until it has checked what happens meanwhile
+        self.release.wait(10)
+        if 'where' in query:
+            body = json.dumps(UPDATED).encode()
+        elif handler.headers.get('If-None-Match') == ETAG:
+            handler.send_response(304)
+            handler.end_headers()
+            return
+        else:
+            body = json.dumps(FULL).encode()
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.send_header('ETag', ETAG)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+@pytest.fixture
+def annuaire(tmp_path, monkeypatch):
+    """The stub API on a local port, with the data module pointed at it and at a fresh cache"""
+    stub = Annuaire()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            stub.respond(self)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setattr(data, 'ANNUAIRE_URL', f'http://127.0.0.1:{server.server_port}/exports/json?lang=fr')
+    monkeypatch.setattr(data, 'CACHE_FILE', tmp_path / 'schools_data_cache.pickle')
+    monkeypatch.setattr(data, 'LEGACY_CACHE_FILE', tmp_path / 'schools_data_cache.json')
+    monkeypatch.setattr(data, '_refresh_thread', None)
+    monkeypatch.setattr(data, '_refresh_listeners', [])
+    yield stub
+    stub.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_and_cache(annuaire):
+    schools = data.download_schools_data()
+
+    assert sorted(schools) == ['0310001A', '0310002B']
+    entry = data._read_cache()
+    assert entry['schools'] == schools
+    assert entry['etag'] == ETAG
+    assert entry['watermark'] == '2025-04-01'
+
+    # A fresh cache is used without any request
+    assert data.download_schools_data() == schools
+    assert len(annuaire.requests) == 1
+
+
+def test_not_modified(annuaire):
+    entry = data._fetch_schools_data(None, None, None)
+    # Past the full refresh interval, the export is revalidated with its ETag
+    entry.update(full_fetched_at=0, fetched_at=0)
+
+    revalidated = data._fetch_schools_data(entry, None, None)
+
+    assert annuaire.requests[-1] == {'where': None, 'if_none_match': ETAG}
+    assert revalidated['schools'] == entry['schools']
+    assert revalidated['fetched_at'] > 0 and revalidated['full_fetched_at'] > 0
+
+
+def test_delta_merge(annuaire):
+    entry = data._fetch_schools_data(None, None, None)
+
+    merged = data._fetch_schools_data(entry, None, None)
+
+    assert annuaire.requests[-1]['where'] == "date_maj_ligne>=date'2025-04-01'"
+    assert sorted(merged['schools']) == ['0310001A', '0310002B', '0310003C']
+    assert merged['schools']['0310002B']['name'] == 'B bis'
+    assert merged['schools']['0310001A'] == entry['schools']['0310001A']
+    assert merged['watermark'] == '2025-05-02'
+    # A delta is not a full download
+    assert merged['full_fetched_at'] == entry['full_fetched_at']
+
+
+def test_stale_cache_refreshes_in_background(annuaire):
+    entry = data._fetch_schools_data(None, None, None)
+    entry['fetched_at'] = time.time() - data.CACHE_DURATION - 1
+    data._write_cache(entry)
+    refreshed = threading.Event()
+    data.add_refresh_listener(refreshed.set)
+
+    annuaire.release.clear()
+    started = time.perf_counter()
+    schools = data.download_schools_data()
+
+    # The stale schools come back at once, while the refresh waits on the API
+    assert time.perf_counter() - started < 1
+    assert schools == entry['schools']
+    assert not refreshed.is_set()
+
+    annuaire.release.set()
+    assert refreshed.wait(10)
+    data._refresh_thread.join(10)
+    assert sorted(data._read_cache()['schools']) == ['0310001A', '0310002B', '0310003C']
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from benchmarks.bench_search import naive_posts, naive_search, random_filters
+from mouvement.annuaire import load_annuaire
+from mouvement.data import load_rep_status, load_schools, read_addresses, read_positions
+from mouvement.facets import FACETS, FacetIndex, build_facets, facet_arrays
+
+
+@pytest.fixture
+def facets(dataset):
+    """The facet index of the synthetic dataset and its posts as a DataFrame"""
+    addresses = read_addresses()
+    geojson, _, _ = load_schools(positions=read_positions(), addresses=addresses,
+                                 schools_dict=load_annuaire(dataset['annuaire']))
+    features = geojson['features']
+    for i, feature in enumerate(features):
+        feature['id'] = i
+    rep_status = load_rep_status()
+    index = FacetIndex(*facet_arrays(build_facets(addresses, features, rep_status)))
+    return index, naive_posts(addresses, features, rep_status)
+
+
+def check(index, posts, filters):
+    ids, count, counts = index.search(filters)
+    expected_ids, expected_count, expected_counts = naive_search(posts, filters)
+    assert ids == expected_ids
+    assert count == expected_count
+    for facet in FACETS:
+        assert {value: n for value, n in counts[facet].items() if n} == expected_counts[facet]
+
+
+def test_search_matches_pandas_filter(facets):
+    index, posts = facets
+    rng = random.Random(0)
+    for _ in range(100):
+        check(index, posts, random_filters(posts, rng))
+
+
+def test_search_without_filters_and_unknown_values(facets):
+    index, posts = facets
+    check(index, posts, {})
+    check(index, posts, {'commune': ['Nowhere']})
+    check(index, posts, {'rep': ['REP', 'REP+'], 'vacant': ['1']})
@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.bench_nearest import brute_nearest
+from benchmarks.bench_spatial import random_points
+from mouvement.nearest import NearestIndex
+
+
+@pytest.fixture
+def index():
+    rng = random.Random(0)
+    points = random_points(400, rng)
+    return NearestIndex(points, [1 if rng.random() < 0.3 else 0 for _ in points],
+                        [rng.random() < 0.1 for _ in points])
+
+
+def assert_same(results, expected):
+    assert len(results) == len(expected)
+    for got, want in zip(results, expected):
+        assert np.allclose([d for d, _ in got], [d for d, _ in want], rtol=0, atol=1e-9)
+        assert [i for _, i in got] == [i for _, i in want]
+
+
+@pytest.mark.parametrize('vacant, rep', [(False, None), (True, None), (True, True), (False, False)])
+def test_query_matches_full_sort(index, vacant, rep):
+    origins = random_points(20, random.Random(1))
+    for n in (1, 10, 1000):
+        assert_same(index.query(origins, n=n, vacant=vacant, rep=rep), brute_nearest(index, origins, n, vacant, rep))
+
+
+def test_query_without_candidates():
+    index = NearestIndex([(43.6, 1.44), (43.7, 1.5)], [0, 0], [False, False])
+    assert index.query([(43.6, 1.44)], n=5, vacant=True, rep=None) == [[]]
+
+
+def test_api_nearest(client):
+    body = client.get('/api/nearest?origin=43.6,1.44&origin=44,2&n=3&vacant=0').get_json()
+    assert [len(result['locations']) for result in body['results']] == [3, 3]
+    distances = [location['distance_km'] for location in body['results'][0]['locations']]
+    assert distances == sorted(distances)
+    assert client.get('/api/nearest?origin=inf,1').status_code == 400
+    assert client.get('/api/nearest?origin=43,1&n=0').status_code == 400
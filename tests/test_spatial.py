@@ -0,0 +1,58 @@
+import math
+import random
+
+import pytest
+
+from benchmarks.bench_spatial import brute_bbox, brute_radius, random_points
+from mouvement.spatial import GridIndex
+
+
+@pytest.fixture
+def points():
+    return random_points(500, random.Random(0))
+
+
+def test_bbox_matches_brute_force(points):
+    index = GridIndex(points)
+    rng = random.Random(1)
+    for _ in range(200):
+        lat, lon = random_points(1, rng)[0]
+        half = rng.uniform(0.001, 3.0)
+        bbox = (lon - half * 1.5, lat - half, lon + half * 1.5, lat + half)
+        assert index.query_bbox(*bbox) == brute_bbox(points, *bbox)
+
+
+def test_bbox_includes_edges_and_handles_empty_boxes(points):
+    index = GridIndex(points)
+    lat, lon = points[7]
+    assert 7 in index.query_bbox(lon, lat, lon, lat)
+    assert index.query_bbox(10, 50, 0, 40) == []
+    assert index.query_bbox(-180, -90, 180, 90) == list(range(len(points)))
+    assert GridIndex([]).query_bbox(-180, -90, 180, 90) == []
+
+
+def test_huge_finite_bounds(points):
+    index = GridIndex(points)
+    everything = list(range(len(points)))
+    assert index.query_bbox(-1e308, -1e308, 1e308, 1e308) == everything
+    assert index.query_bbox(-1e308, 43, 1e308, 44) == brute_bbox(points, -1e308, 43, 1e308, 44)
+    assert index.query_bbox(1e308, 43, 1e308, 44) == []
+    assert index.query_bbox(-1e308, -1e308, -1e307, -1e307) == []
+    assert sorted(index.query_radius(43, 1, 1e308)) == everything
+
+
+def test_radius_matches_brute_force(points):
+    index = GridIndex(points)
+    rng = random.Random(2)
+    for _ in range(50):
+        lat, lon = random_points(1, rng)[0]
+        radius_km = rng.uniform(0.5, 200)
+        assert index.query_radius(lat, lon, radius_km) == brute_radius(points, lat, lon, radius_km)
+
+
+def test_non_finite_queries_raise_value_error(points):
+    index = GridIndex(points)
+    with pytest.raises(ValueError):
+        index.query_bbox(-math.inf, 43, math.inf, 44)
+    with pytest.raises(ValueError):
+        index.query_radius(43, 1, math.nan)